@@ -0,0 +1,130 @@
+"""
+Lockstep simulator that plays many headless games at once, for GA fitness and weight sweeps.
+All boards are kept in one (N, rows, cols) array. Each step drops every running game's piece, clears lines
+and updates scores with NumPy operations over the whole batch. Games that end leave the batch.
+Follows the rules of GameEngine, so a game with the same seed and placements ends with the same score.
+"""
+import random
+import numpy as np
+from tetris import pieceNames, pieceDefs, baseLinePoints, getPlacementDef, getSpawnRow, getSpawnCol, STARTING_LEVEL, ROW, COL
+
+class BatchEngine:
+	"""
+	Plays gameNum games in lockstep, one piece placement per game and step.
+	Each game has its own random piece sequence, seeded by seeds[i] like GameEngine(seed=seeds[i]).
+	"""
+	def __init__(self, gameNum, colNum=10, rowNum=20, seeds=None, previewNum=1, maxPieces=None):
+		self.colNum = colNum
+		self.rowNum = rowNum
+		self.spawnCol = getSpawnCol(colNum) # column of the spawn origin, as in MovingPiece.spawn
+		self.maxPieces = maxPieces # games that placed this many pieces leave the batch without a game over, None plays them to the end
+		if seeds is None:
+			seeds = [None] * gameNum
+		self.randoms = [random.Random(seed) for seed in seeds]
+		self.nextPieces = [[pieceNames[rng.randint(0, 6)] for i in range(previewNum + 1)] for rng in self.randoms] # current piece followed by the preview queue
+
+		self.boards = np.zeros((gameNum, rowNum, colNum), dtype=np.int8)
+		self.scores = np.zeros(gameNum, dtype=np.int64)
+		self.lines = np.zeros(gameNum, dtype=np.int64)
+		self.levels = np.full(gameNum, STARTING_LEVEL, dtype=np.int64)
+		self.pieceCounts = np.zeros(gameNum, dtype=np.int64)
+		self.gameOver = np.zeros(gameNum, dtype=bool)
+		self.active = np.arange(gameNum) # indices of the games still being played
+		self.checkSpawn(self.active)
+		self.updateActive()
+
+		# block rows and columns of every placement definition, and the row its hard drop starts from, by piece type and orientation
+		self.placementDefs = {}
+		self.spawnRows = {}
+		for pieceType in pieceNames:
+			for orientation in range(4):
+				pieceDef = getPlacementDef(pieceType, orientation)
+				self.placementDefs[pieceType, orientation] = (np.array([pos[ROW] for pos in pieceDef]), np.array([pos[COL] for pos in pieceDef]))
+				self.spawnRows[pieceType, orientation] = getSpawnRow(pieceType, orientation)
+
+	def checkSpawn(self, games):
+		"""Ends the games whose current piece collides where it spawns, like GameEngine.spawnPiece."""
+		for g in games:
+			for pos in pieceDefs[self.nextPieces[g][0]]:
+				if self.boards[g, pos[ROW], self.spawnCol + pos[COL]]:
+					self.gameOver[g] = True
+					break
+
+	def updateActive(self):
+		running = ~self.gameOver[self.active]
+		if self.maxPieces is not None:
+			running &= self.pieceCounts[self.active] < self.maxPieces
+		self.active = self.active[running]
+
+	def getActivePieces(self):
+		"""Returns the current piece and preview queue of each active game, in the order of self.active."""
+		return [self.nextPieces[g] for g in self.active]
+
+	def step(self, orientations, cols):
+		"""
+		Drops the current piece of every active game with the given placements, in the order of self.active, and spawns the next ones.
+		A placement is (orientation, col) as in GameEngine.step.
+		Returns the games stepped, the number of lines each cleared and their game over flags.
+		"""
+		games = self.active
+		orientations = np.asarray(orientations)
+		cols = np.asarray(cols)
+		blockRows = np.empty((len(games), 4), dtype=int)
+		blockCols = np.empty((len(games), 4), dtype=int)
+		spawnRows = np.empty(len(games), dtype=int)
+		for i, g in enumerate(games):
+			blockRows[i], blockCols[i] = self.placementDefs[self.nextPieces[g][0], orientations[i]]
+			spawnRows[i] = self.spawnRows[self.nextPieces[g][0], orientations[i]]
+		blockCols = blockCols + cols[:, np.newaxis]
+		if (cols < 0).any() or (blockCols >= self.colNum).any():
+			raise ValueError("Placement column out of the board in games %s" % games[(cols < 0) | (blockCols >= self.colNum).any(axis=1)])
+
+		# landing row from the column heights under each block, as GameEngine.getDropRow finds it from the top
+		boards = self.boards[games]
+		filled = boards != 0
+		heights = np.where(filled.any(axis=1), self.rowNum - filled.argmax(axis=1), 0)
+		rows = (self.rowNum - np.take_along_axis(heights, blockCols, axis=1) - 1 - blockRows).min(axis=1)
+		placed = rows >= 0 # the others cannot enter the board at that column
+		self.gameOver[games[~placed]] = True
+
+		cellGames = np.repeat(np.arange(len(games))[placed], 4)
+		boards[cellGames, (rows[:, np.newaxis] + blockRows)[placed].ravel(), blockCols[placed].ravel()] = 1
+
+		# LINE COMPLETION, full rows are moved to the top in order and emptied
+		full = (boards != 0).all(axis=2)
+		lineCounts = full.sum(axis=1)
+		if lineCounts.any():
+			order = np.argsort(~full, axis=1, kind='stable')
+			boards = np.take_along_axis(boards, order[:, :, np.newaxis], axis=1)
+			boards[np.arange(self.rowNum)[np.newaxis, :] < lineCounts[:, np.newaxis]] = 0
+		self.boards[games[placed]] = boards[placed]
+
+		# SCORES, leveling every 10 lines. Hard drops score the rows fallen from the spawn row
+		scored = games[placed]
+		dropScores = np.maximum(rows - spawnRows, 0) # as tetris.getDropScore finds them
+		self.scores[scored] += (self.levels[scored] + 1) * np.array(baseLinePoints)[lineCounts[placed]] + dropScores[placed]
+		self.lines[scored] += lineCounts[placed]
+		self.levels[scored] = np.minimum(STARTING_LEVEL + self.lines[scored] // 10, 99)
+		self.pieceCounts[scored] += 1
+
+		for g in scored:
+			self.nextPieces[g].pop(0)
+			self.nextPieces[g].append(pieceNames[self.randoms[g].randint(0, 6)])
+		self.checkSpawn(scored)
+		self.updateActive()
+
+		return games, np.where(placed, lineCounts, 0), self.gameOver[games]
+
+
+def playGames(tBot, engine, weights=None):
+	"""
+	Plays all of the engine's games to the end, choosing every active game's move in one Bot.runBatch() search per step.
+	weights optionally gives each game its own bot weights as a (gameNum, features) array.
+	Returns the final scores.
+	"""
+	if weights is not None:
+		weights = np.asarray(weights, dtype=float)
+	while len(engine.active):
+		orientations, cols = tBot.runBatch(engine.boards[engine.active], engine.getActivePieces(), None if weights is None else weights[engine.active])
+		engine.step(orientations, cols)
+	return engine.scores
@@ -0,0 +1,288 @@
+"""
+Benchmarks for the bot's search kernels and for end-to-end game throughput.
+Micro-benchmarks time Bot.generatePosition, Bot.objFunc, Bot.getColumnHeights and Bot.createTree
+on a fixed corpus of boards. Macro-benchmarks play seeded GameEngine games with the bot.
+
+python benchmark.py --output results.json
+python benchmark.py --compare results.json
+python benchmark.py --size 100 50 # rows and columns, to see how the cost grows with the board area
+python benchmark.py --budget 5 --preview 3 # checks that timed decisions stay within 5 ms
+"""
+from tetris import GameEngine, MovingPiece, key, pieceNames
+import argparse
+import copy
+import json
+import platform
+import random
+import sys
+import time
+import numpy as np
+import bot
+import kernels
+from profiling import profiler
+from placements import getPlacementArrays
+
+CORPUS_SEED = 476
+CORPUS_FILLS = (('empty', 0), ('low', 4), ('mid', 8), ('high', 12), ('nearTop', 17)) # board name, filled rows of 20, scaled to the board height
+BENCH_PIECES = ('T', 'L') # current and next piece used by the micro-benchmarks
+WARM_UP_PIECES = 5 # pieces played before the latency of timed decisions is measured
+COMPARED_META = ('backend', 'size', 'preview', 'budget', 'jit') # settings a baseline must share with the results to be compared
+
+def makeCorpus(rowNum=20, colNum=10, seed=CORPUS_SEED):
+	"""
+	Returns a list of (name, blockMat) boards, from empty to near-topped.
+	Boards are filled from the floor with rows that each keep one or two gaps, plus a ragged top row.
+	"""
+	rng = random.Random(seed)
+	corpus = []
+	for name, filledRows in CORPUS_FILLS:
+		filledRows = filledRows * rowNum // 20
+		blockMat = [['empty'] * colNum for i in range(rowNum)]
+		for row in range(rowNum - filledRows, rowNum):
+			gaps = rng.sample(range(colNum), rng.randint(1, 2))
+			for col in range(colNum):
+				if col not in gaps:
+					blockMat[row][col] = pieceNames[rng.randint(0, 6)]
+		if 0 < filledRows < rowNum:
+			for col in rng.sample(range(colNum), colNum // 2):
+				blockMat[rowNum - filledRows - 1][col] = pieceNames[rng.randint(0, 6)]
+		corpus.append((name, blockMat))
+	return corpus
+
+
+def prepareBot(blockMat, backend):
+	"""Returns a bot updated with the given board and BENCH_PIECES, ready to search."""
+	rowNum = len(blockMat)
+	colNum = len(blockMat[0])
+	piece = MovingPiece(colNum, rowNum, 'moving')
+	piece.type = BENCH_PIECES[0]
+	tBot = bot.Bot(backend)
+	tBot.update(copy.deepcopy(blockMat), piece, list(BENCH_PIECES), 'running', key)
+	return tBot
+
+
+def timeCall(func, number, repeat):
+	"""Returns the best time per call in microseconds over repeat runs of number calls."""
+	best = None
+	for r in range(repeat):
+		start = time.perf_counter()
+		for i in range(number):
+			func()
+		elapsed = (time.perf_counter() - start) / number
+		if best is None or elapsed < best:
+			best = elapsed
+	return best * 1e6
+
+
+def timeObjFunc(tBot, root, number, repeat):
+	"""Returns the best time per Bot.objFunc call in microseconds, on the boards of the root's children."""
+	tree = tBot.tree
+	tree.truncate(root + 1)
+	children = tBot.createNodes(np.array([root]), BENCH_PIECES[0])
+	boards = [copy.copy(tree.getBoard(i)) for i in children] # scratch boards, taken again by the next batch
+	boards = (boards * (number // len(boards) + 1))[:number]
+	tree.truncate(root + 1)
+	best = None
+	for r in range(repeat):
+		start = time.perf_counter()
+		for data in boards:
+			tBot.objFunc(data)
+		elapsed = (time.perf_counter() - start) / number
+		if best is None or elapsed < best:
+			best = elapsed
+	return best * 1e6
+
+
+def runMicro(backend, number, repeat, rowNum=20, colNum=10):
+	"""Returns {kernel: {board name: microseconds per call}} over the corpus of rowNum x colNum boards."""
+	results = {'generatePosition': {}, 'objFunc': {}, 'getColumnHeights': {}, 'createTree': {}}
+	for name, blockMat in makeCorpus(rowNum, colNum):
+		tBot = prepareBot(blockMat, backend)
+		root = tBot.createRoot()
+		parents = np.array([root])
+		placements = getPlacementArrays(BENCH_PIECES[0], len(blockMat[0]))
+		results['generatePosition'][name] = timeCall(lambda: tBot.generatePosition(parents, placements), number, repeat)
+		results['objFunc'][name] = timeObjFunc(tBot, root, number, repeat)
+		results['getColumnHeights'][name] = timeCall(lambda: tBot.getColumnHeights(tBot.tree.getBoard(root)), number, repeat)
+		results['createTree'][name] = timeCall(lambda: tBot.createTree(None, 0), max(1, number // 20), repeat)
+	return results
+
+
+def runMacro(backend, seeds, maxPieces, rowNum=20, colNum=10, previewNum=1, timeBudget=None):
+	"""
+	Plays one seeded GameEngine game per seed on a rowNum x colNum board, capped at maxPieces, and returns the throughput.
+	With a time budget in milliseconds, also returns the latency percentiles of the decisions and how many went over it.
+	"""
+	pieces = 0
+	decisionTimes = []
+	scores = []
+	if timeBudget is not None:
+		# the first decisions compile or load the kernels, which is not a search cost
+		warmUp = bot.Bot(backend, timeBudget=timeBudget)
+		engine = GameEngine(colNum, rowNum, seed=seeds[0], previewNum=previewNum)
+		while engine.pieceCount < WARM_UP_PIECES:
+			warmUp.update(engine.occupancy, engine.piece, engine.nextPieces, engine.gameStatus, key, engine.occupancyVersion)
+			warmUp.run()
+			engine.step(warmUp.getPlacement())
+	start = time.perf_counter()
+	for seed in seeds:
+		engine = GameEngine(colNum, rowNum, seed=seed, previewNum=previewNum)
+		tBot = bot.Bot(backend, timeBudget=timeBudget)
+		gameOver = False
+		while not gameOver and engine.pieceCount < maxPieces:
+			tBot.update(engine.occupancy, engine.piece, engine.nextPieces, engine.gameStatus, key, engine.occupancyVersion)
+			decisionStart = time.perf_counter()
+			tBot.run()
+			decisionTimes.append(time.perf_counter() - decisionStart)
+			lines, score, gameOver = engine.step(tBot.getPlacement())
+		pieces += engine.pieceCount
+		scores.append(engine.score)
+	elapsed = time.perf_counter() - start
+	decisionTime = sum(decisionTimes)
+	results = {
+		'piecesPerSecond': pieces / elapsed,
+		'decisionsPerSecond': len(decisionTimes) / decisionTime if decisionTime else 0.0,
+		'pieces': pieces,
+		'scores': scores,
+	}
+	if timeBudget is not None:
+		latencies = np.array(decisionTimes) * 1000
+		results['latency'] = {
+			'budget': timeBudget,
+			'p50': float(np.percentile(latencies, 50)),
+			'p95': float(np.percentile(latencies, 95)),
+			'max': float(latencies.max()),
+			'overBudget': int((latencies > timeBudget).sum()),
+			'decisions': len(latencies),
+		}
+	return results
+
+
+def flattenMetrics(results):
+	"""Returns {metric name: (value, higher is better)} for the comparable metrics of a result dict."""
+	metrics = {}
+	for kernel, boards in results.get('micro', {}).items():
+		for name, value in boards.items():
+			metrics['micro.%s.%s' % (kernel, name)] = (value, False)
+	macro = results.get('macro', {})
+	for name in ('piecesPerSecond', 'decisionsPerSecond'):
+		if name in macro:
+			metrics['macro.' + name] = (macro[name], True)
+	return metrics
+
+
+def compareMeta(results, baseline):
+	"""Returns a list of (setting name, baseline value, new value) for the COMPARED_META settings the baseline was run with differently."""
+	meta = results.get('meta', {})
+	baseMeta = baseline.get('meta', {})
+	return [(name, baseMeta.get(name), meta.get(name)) for name in COMPARED_META if baseMeta.get(name) != meta.get(name)]
+
+
+def compareResults(results, baseline, tolerance):
+	"""Returns a list of (metric name, baseline value, new value, change) for metrics that got worse by more than tolerance."""
+	regressions = []
+	baseMetrics = flattenMetrics(baseline)
+	for name, (value, higherIsBetter) in flattenMetrics(results).items():
+		if name not in baseMetrics or baseMetrics[name][0] == 0:
+			continue
+		baseValue = baseMetrics[name][0]
+		change = (value - baseValue) / baseValue
+		if (higherIsBetter and change < -tolerance) or (not higherIsBetter and change > tolerance):
+			regressions.append((name, baseValue, value, change))
+	return regressions
+
+
+def printResults(results):
+	"""Prints the results as a table."""
+	for kernel, boards in results.get('micro', {}).items():
+		print("%-18s" % kernel + "".join("%12s" % ("%s" % name) for name in boards))
+		print("%-18s" % "  us/call" + "".join("%12.1f" % value for value in boards.values()))
+	macro = results.get('macro')
+	if macro:
+		print("pieces/s: %.1f  decisions/s: %.1f  pieces: %d  scores: %s" % (macro['piecesPerSecond'], macro['decisionsPerSecond'], macro['pieces'], macro['scores']))
+		latency = macro.get('latency')
+		if latency:
+			print("latency ms, budget %g: p50 %.2f  p95 %.2f  max %.2f  over budget: %d of %d decisions" % (latency['budget'], latency['p50'], latency['p95'], latency['max'], latency['overBudget'], latency['decisions']))
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmarks the bot's search kernels and game throughput.")
+	parser.add_argument('--backend', default='numpy', choices=('numpy', 'bitboard'))
+	parser.add_argument('--number', type=int, default=200, help="calls per timing run of the micro-benchmarks")
+	parser.add_argument('--repeat', type=int, default=5, help="timing runs per micro-benchmark, the best is kept")
+	parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2], help="seeds of the macro-benchmark games")
+	parser.add_argument('--max-pieces', type=int, default=300, help="piece cap of each macro-benchmark game")
+	parser.add_argument('--size', type=int, nargs=2, default=[20, 10], metavar=('ROWS', 'COLS'), help="board size of the corpus and the games")
+	parser.add_argument('--preview', type=int, default=1, help="preview pieces of the macro-benchmark games, each one a depth of the search")
+	parser.add_argument('--budget', type=float, help="time budget per decision in milliseconds. Fails when the 95th percentile decision goes over it")
+	parser.add_argument('--no-jit', action='store_true', help="uses the NumPy code instead of the Numba kernels, see kernels.py")
+	parser.add_argument('--skip-micro', action='store_true')
+	parser.add_argument('--skip-macro', action='store_true')
+	parser.add_argument('--output', help="writes the results to this JSON file")
+	parser.add_argument('--compare', help="baseline JSON file to check the results against")
+	parser.add_argument('--tolerance', type=float, default=0.10, help="relative slowdown allowed before a metric counts as a regression")
+	parser.add_argument('--profile', help="instruments the macro-benchmark and writes the profiler summary to this JSON file")
+	parser.add_argument('--capture', type=int, nargs=2, metavar=('FIRST', 'LAST'), help="with --profile, takes a cProfile and tracemalloc capture of these decisions")
+	args = parser.parse_args()
+	kernels.setJit(not args.no_jit)
+
+	results = {
+		'meta': {
+			'backend': args.backend,
+			'python': platform.python_version(),
+			'numpy': np.__version__,
+			'jit': kernels.jitEnabled,
+			'size': args.size,
+			'preview': args.preview,
+			'budget': args.budget,
+			'machine': platform.machine(),
+			'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+		},
+	}
+	if not args.skip_micro:
+		results['micro'] = runMicro(args.backend, args.number, args.repeat, *args.size)
+	if not args.skip_macro:
+		if args.profile:
+			profiler.enable()
+			if args.capture:
+				profiler.captureDecisions(args.capture[0], args.capture[1], profile=True, memory=True)
+		results['macro'] = runMacro(args.backend, args.seeds, args.max_pieces, *args.size, args.preview, args.budget)
+		if args.profile:
+			profiler.disable()
+			profiler.dump(args.profile)
+	printResults(results)
+
+	failed = False
+	latency = results.get('macro', {}).get('latency')
+	if latency and latency['p95'] > latency['budget']:
+		print("OVER BUDGET: 95th percentile decision took %.2f ms of %g ms" % (latency['p95'], latency['budget']))
+		failed = True
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(results, f, indent=2)
+
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)
+		mismatches = compareMeta(results, baseline)
+		for name, baseValue, value in mismatches:
+			print("SETTINGS MISMATCH %s: baseline %s, now %s" % (name, baseValue, value))
+		if mismatches:
+			print("not compared against %s, it was run with other settings" % args.compare)
+			sys.exit(1)
+		regressions = compareResults(results, baseline, args.tolerance)
+		if 'macro' in results and 'macro' in baseline and results['macro']['scores'] != baseline['macro'].get('scores'):
+			print("note: game scores differ from the baseline, so the bot's decisions changed")
+		for name, baseValue, value, change in regressions:
+			print("REGRESSION %s: %.2f -> %.2f (%+.0f%%)" % (name, baseValue, value, change * 100))
+		if regressions:
+			failed = True
+		else:
+			print("no regressions against %s" % args.compare)
+
+	if failed:
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,93 @@
+"""
+Bitboard representation of a Tetris board for the bot's search.
+Each row is an integer where bit j is set when column j is filled. Row 0 is the top row.
+"""
+import numpy as np
+
+def fromArray(data):
+	"""Returns the rows of a 2d board of 0 (empty) and non-zero (filled) cells as integers."""
+	rows = []
+	for row in data:
+		bits = 0
+		for j, cell in enumerate(row):
+			if cell != 0:
+				bits |= 1 << j
+		rows.append(bits)
+	return rows
+
+
+def toArray(rows, colNum):
+	"""Returns the rows as a 2d list of 0s and 1s."""
+	return [[(bits >> j) & 1 for j in range(colNum)] for bits in rows]
+
+
+def toArrays(boards, colNum):
+	"""Returns a list of boards of the same size as an (N, rows, cols) int8 array, converted together while rows fit in int64."""
+	if colNum >= 64:
+		return np.array([toArray(rows, colNum) for rows in boards], dtype=np.int8)
+	rows = np.array(boards, dtype=np.int64)
+	return ((rows[:, :, np.newaxis] >> np.arange(colNum)) & 1).astype(np.int8)
+
+
+def fromArrays(data):
+	"""Returns the rows of each board of an (N, rows, cols) array as lists of integers."""
+	if data.shape[2] >= 64:
+		return [fromArray(board) for board in data]
+	return ((data != 0).astype(np.int64) @ (1 << np.arange(data.shape[2], dtype=np.int64))).tolist()
+
+
+def pieceMasks(pieceDef, col):
+	"""Returns (row offset, mask) pairs of a normalized piece definition placed with its leftmost column at col."""
+	masks = {}
+	for pos in pieceDef:
+		masks[pos[0]] = masks.get(pos[0], 0) | (1 << (pos[1] + col))
+	return sorted(masks.items())
+
+
+def place(rows, masks, row):
+	"""Returns a copy of rows with the piece masks set at row. Cells above the board are dropped."""
+	newRows = list(rows)
+	for offset, mask in masks:
+		if row + offset >= 0:
+			newRows[row + offset] |= mask
+	return newRows
+
+
+def clearLines(rows, colNum):
+	"""Removes full rows. Returns the new rows and the number of rows removed."""
+	full = (1 << colNum) - 1
+	remaining = [bits for bits in rows if bits != full]
+	lineCount = len(rows) - len(remaining)
+	if lineCount:
+		remaining = [0] * lineCount + remaining
+	return remaining, lineCount
+
+
+def columnHeights(rows, colNum):
+	"""Returns a list of the column heights, measured from the floor to the highest filled cell."""
+	rowNum = len(rows)
+	heights = [0] * colNum
+	seen = 0
+	for i, bits in enumerate(rows):
+		new = bits & ~seen
+		if new:
+			seen |= new
+			while new:
+				low = new & -new
+				heights[low.bit_length() - 1] = rowNum - i
+				new ^= low
+	return heights
+
+
+def columnHoles(rows, colNum):
+	"""Returns a list of the hole counts of each column."""
+	holes = [0] * colNum
+	covered = 0
+	for bits in rows:
+		gaps = covered & ~bits
+		while gaps:
+			low = gaps & -gaps
+			holes[low.bit_length() - 1] += 1
+			gaps ^= low
+		covered |= bits
+	return holes
@@ -1,24 +1,35 @@
 import pygame #version 2.5.2
-import copy
+import time
+import threading
 import numpy as np
-import matplotlib.image
+import bitboard
+import kernels
+from features import DEFAULT_FEATURES, BoardStats, clearBoards, getFeatures, scoreFeatures
+from placements import PLACEMENT_TABLE, getPlacementArrays, landingRows
+from searchtree import SearchTree, TreeNode
+from transposition import ZobristKeys, TranspositionTable
+
+EVAL_CHUNK_SIZE = 256 # nodes evaluated per batch when searching with a time budget
+CHUNK_COST_MARGIN = 2.0 # a timed batch is predicted to cost this many times the last one per node, as their cost varies
+SCRATCH_CELLS = 1 << 22 # board cells of the children built and evaluated per batch otherwise, a whole level of a 10x20 search
+BATCH_CHUNK_SIZE = 128 # nodes expanded per evaluateBatch call by runBatch() on a 10x20 board, each can have up to 34 children. Fewer on larger boards
+# mini-board colour of each cell value: 0 empty, 1 filled, 10 the chosen placement. Values in between are unused
+MINI_BOARD_PALETTE = np.array(((0x33, 0x33, 0x33), (0xcc, 0x22, 0x22), (0x00, 0x66, 0x00), (0x08, 0x77, 0x00), (0x10, 0x88, 0x00), (0x18, 0x99, 0x00),
+	(0x20, 0xaa, 0x00), (0x28, 0xbb, 0x00), (0x30, 0xcc, 0x00), (0x38, 0xdd, 0x00), (0x40, 0xff, 0x00)), dtype=np.uint8)
+MINI_BOARD_SIZE = (100, 200) # area the mini-board is scaled to fit, keeping its cells square
+MINI_BOARD_POS = (680, 380)
+
+class Speculation:
+	"""A background search of the next piece's placement, on the board predicted after the current piece locks."""
+	def __init__(self, rows, knownPieces):
+		self.rows = rows # predicted board as bitboard rows
+		self.knownPieces = knownPieces # piece types of the next decision known in advance, all but the last of its queue
+		self.results = {} # (depth 1 node, completed depth) by the piece type that ends the queue
+		self.ready = {pieceType: threading.Event() for pieceType in PLACEMENT_TABLE} # set once the piece type's result is in results
+		self.cancelled = False
+		self.failed = False # set if the search raised, its results are then not used
+		self.thread = None
 
-class TreeNode:
-	"""
-	Class for the nodes in the decision search tree.
-	Holds values about the associated positions.
-	"""
-	def __init__(self, data):
-		self.data = data
-		self.parent = None
-		self.children = []
-		self.evaluation = 0
-		self.coords = [0,0]
-		self.avgColumnHeight = 0
-		self.bumpiness = 0
-		self.holes = 0
-		self.lines = 0
-		self.orientation = 0
 
 class Bot:
 	"""
@@ -27,108 +38,396 @@ class Bot:
 	evaluation.\n
 	Moves the current piece into target position.
 	"""
-	def __init__(self):
+	def __init__(self, backend='numpy', cacheBytes=0, beamWidth=64, timeBudget=None, speculative=False, instantDrop=False, features=DEFAULT_FEATURES):
+		self.backend = backend # 'numpy' keeps search boards as 2d arrays, 'bitboard' as lists of row integers
+		self.speculative = speculative # searches the next piece in a background thread while the current one falls
+		self.speculation = None
+		self.speculator = None # bot running the speculations, reused once the thread of its last one has ended
+		self.speculatorThread = None
+		self.searchedSpeculation = None # on a speculating bot, the Speculation its thread searches. Cancelling it ends the search early
+		self.speculationHits = 0 # decisions served by a finished speculation, and speculations discarded
+		self.speculationMisses = 0
+		self.instantDrop = instantDrop # movement() places each piece within one frame instead of steering it with the keys
+		self.rotationPlan = [] # rotations movement() still has to apply to the current piece
+		self.targetBlockCol = None # column the piece's first block has to reach, known once the rotations are applied
+		self.beamWidth = beamWidth # best nodes of each depth kept for expanding the next one, None expands all of them
+		self.timeBudget = timeBudget # milliseconds per decision, None always searches the whole queue
+		self.deadline = None
+		self.nodeSeconds = 0.0 # time the last full batch of a timed search took per node, to predict whether the next one fits before the deadline
+		self.finishSeconds = 0.0 # time the last timed decision took after its search, reserved before the deadline
+		self.completedDepth = 0 # deepest depth fully searched by the last decision
+		self.deepestLevel = [] # node indices of the deepest depth of the last search
+		self.transpositionTable = TranspositionTable(cacheBytes) if cacheBytes else None # evaluations by Zobrist hash, kept across pieces. Off when cacheBytes is 0 or a feature uses the placement
+		self.zobristKeys = None
 		self.boardArr = None # current board layout in a numpy 2d array
-		self.colorMap = matplotlib.colors.LinearSegmentedColormap.from_list("custom", ["#333333", "#cc2222", "#006600", "#087700", "#108800", "#189900", "#20aa00", "#28bb00", "#30cc00", "#38dd00", "#40ff00"])
+		self.boardRows = None # current board layout as bitboard rows
+		self.occupancySource = None # occupancy mirror boardArr was last built from, and its version
+		self.occupancyVersion = None
+		self.miniBoard = None # board of the last decision with its target marked, drawn by drawBoard()
+		self.miniBoardSurface = None # rendered from miniBoard on the first draw after each decision
 		self.checkedPositions = [] # list of numpy 2d arrays
 		self.targetPosition = [0,0]
-		self.searchTree = None
-		self.bestNode = TreeNode(None)
+		self.tree = None # SearchTree, kept from one decision to the next so its arrays are reused
+		self.bestNode = TreeNode()
 		self.orientation = 0
 		self.key = None
 
-		self.avgHeightWeight = 1.392
-		self.bumpinessWeight = 0.861
-		self.holesWeight = 4.540
-		self.lineWeight = -0.193
+		self.features = tuple(features) # names of the registered features boards are scored with, see features.py
+		self.featureList = getFeatures(self.features)
+		self.usesPlacement = any(feature.usesPlacement for feature in self.featureList)
+		self.usesScan = any(feature.usesScan for feature in self.featureList)
+		self.weights = [feature.defaultWeight for feature in self.featureList] # one per feature, DEFAULT_FEATURES start with the tuned weights
+		if self.usesPlacement:
+			# the table is keyed by the board alone, but these evaluations also depend on the placement that reached it
+			self.transpositionTable = None
 
 	
 	def setWeights(self, weights : list):
-		"""Sets bot weights in order of avgHeight, bumpiness, holes, lines."""
-		self.avgHeightWeight = weights[0]
-		self.bumpinessWeight = weights[1]
-		self.holesWeight = weights[2]
-		self.lineWeight = weights[3]
+		"""Sets bot weights, one per feature in the order of self.features. By default avgHeight, bumpiness, holes, lines."""
+		if len(weights) != len(self.features):
+			raise ValueError("Expected %d weights for the features %s, got %d" % (len(self.features), ', '.join(self.features), len(weights)))
+		self.weights = [float(weight) for weight in weights]
+		if self.transpositionTable is not None:
+			self.transpositionTable.clear() # cached evaluations used the old weights
+		self.speculation = None # searched with the old weights
+
+
+	def getCacheStats(self):
+		"""Returns the transposition table's hit/miss counters as a dict, or None if caching is off."""
+		if self.transpositionTable is None:
+			return None
+		return self.transpositionTable.getStats()
 		
 
-	def update(self, blockMat, movingPiece, nextPieces, gameStatus, key):
+	def update(self, blockMat, movingPiece, nextPieces, gameStatus, key, occupancyVersion=None):
 		"""
 		Updates various data every frame.
-		To do this, it takes in a MainBoard's blockMat, movingPiece, nextPieces, gameStatus, and key.
+		To do this, it takes in a MainBoard's blockMat, movingPiece, nextPieces, gameStatus, and key.\n
+		When occupancyVersion is given, blockMat is the board's numeric occupancy mirror instead (MainBoard.occupancy),
+		and the bot's copy of the board is only rebuilt when the mirror or its version changed.
 		"""
-		for i in range(len(blockMat)):
-			for j in range(len(blockMat[i])):
-				if blockMat[i][j] == "empty":
-					blockMat[i][j] = 0
-				else:
-					blockMat[i][j] = 1
-		
-		self.boardArr = np.array(blockMat)
+		if occupancyVersion is None:
+			for i in range(len(blockMat)):
+				for j in range(len(blockMat[i])):
+					if blockMat[i][j] == "empty":
+						blockMat[i][j] = 0
+					else:
+						blockMat[i][j] = 1
+			
+			self.boardArr = np.array(blockMat)
+			self.boardRows = bitboard.fromArray(self.boardArr)
+			self.occupancySource = None
+		elif blockMat is not self.occupancySource or occupancyVersion != self.occupancyVersion:
+			self.boardRows = list(blockMat)
+			self.boardArr = bitboard.toArrays([self.boardRows], movingPiece.colNum)[0]
+			self.occupancySource = blockMat
+			self.occupancyVersion = occupancyVersion
+
 		self.movingPiece = movingPiece
 		self.nextPieces = nextPieces # nextPieces[0] is current piece, nextPieces[1] is next piece
 		self.gameStatus = gameStatus
 		self.key = key
-		self.maxTreeDepth = len(nextPieces) # 2
+		self.maxTreeDepth = len(nextPieces) # current piece plus the preview queue
 
 	
 	def run(self):
 		"""Called every time a new block appears."""
 		if self.gameStatus == 'running':
-			self.nextPiece = copy.deepcopy(self.movingPiece)
-			self.nextPiece.type = self.nextPieces[1]
-			self.nextPiece.spawn()
 			self.orientation = 0
 
-			# Create the search tree and choose the position leading to the best outcome
-			self.createTree(None, 0)
-			self.bestNode = self.chooseBest()
-			if self.bestNode.parent != None:
-				self.bestNode = self.bestNode.parent
+			# Create the search tree and choose the position leading to the best outcome, unless the background search already did
+			if self.timeBudget is not None:
+				self.deadline = time.perf_counter() + self.timeBudget / 1000 - self.finishSeconds
+			speculated = self.takeSpeculation()
+			if speculated is not None:
+				self.bestNode = speculated
+			else:
+				self.createTree(None, 0)
+				finishStart = time.perf_counter()
+				self.bestNode = self.chooseMove()
+			self.compilePlan()
 					
-			# Update the target position for movement and nullify the search tree for the next call
+			# Update the target position for movement
 			self.targetPosition = self.bestNode.coords
-			self.searchTree = None
+			self.deepestLevel = []
 
 			# Updates mini-board
-			self.boardArr[self.bestNode.coords[0]][self.bestNode.coords[1]] = 10
-			matplotlib.image.imsave('images/board.png', self.boardArr, cmap=self.colorMap)
+			miniBoard = self.boardArr.copy() # boardArr is kept for later searches while the board's version is unchanged
+			miniBoard[self.bestNode.coords[0]][self.bestNode.coords[1]] = 10
+			self.miniBoard = miniBoard
+			self.miniBoardSurface = None
+			if speculated is None and self.timeBudget is not None:
+				self.finishSeconds = time.perf_counter() - finishStart
+
+			if self.speculative:
+				self.speculate()
+
+
+	def chooseMove(self):
+		"""Returns a TreeNode copy of the current piece's placement node leading to the best node of the search tree."""
+		node = self.chooseBest()
+		if node < 0:
+			return TreeNode()
+		parent = self.tree.parent
+		while parent[node] != -1 and parent[parent[node]] != -1:
+			node = parent[node] # back up to the current piece's placement
+		self.restoreBoards(np.array([node])) # its board is the prediction speculate() searches from
+		return self.tree.getNode(node)
+
+
+	def speculate(self):
+		"""
+		Starts searching the next piece's placement in a background thread, on the board predicted once the chosen placement locks.
+		The piece ending the next decision's queue is not known yet, so there is one search for each piece type it can be.
+		"""
+		self.speculation = None
+		if self.bestNode.data is None:
+			return
+		if self.backend == 'bitboard':
+			rows = list(self.bestNode.data)
+		else:
+			rows = bitboard.fromArray(self.bestNode.data)
+		speculation = Speculation(rows, list(self.nextPieces[1:self.maxTreeDepth]))
+
+		# a separate bot, so the search shares no state with the frame loop
+		speculator = self.speculator
+		if speculator is None or self.speculatorThread.is_alive():
+			speculator = Bot(self.backend, 0, self.beamWidth, self.timeBudget, features=self.features)
+		speculator.setWeights(self.weights)
+		speculator.boardRows = rows
+		speculator.boardArr = bitboard.toArrays([rows], self.boardArr.shape[1])[0]
+		speculation.thread = threading.Thread(target=speculator.searchSpeculation, args=(speculation,), daemon=True)
+		speculation.thread.start()
+		self.speculation = speculation
+		self.speculator = speculator
+		self.speculatorThread = speculation.thread
+
+
+	def searchSpeculation(self, speculation):
+		"""
+		Thread body of speculate(), run on the speculating bot.
+		The known pieces are searched once, then the last depth is expanded again for each piece type that can end the queue.
+		With a time budget the known pieces and each expansion get a budget of their own, and when the known pieces
+		did not all fit, their search is the result for every piece type.
+		Every ready event is set when the thread ends, even if the search raised, so takeSpeculation() is never left waiting.
+		"""
+		time.sleep(0) # hands the interpreter back, so the decision that started the thread ends without waiting a switch interval for it
+		self.searchedSpeculation = speculation
+		try:
+			if self.timeBudget is not None:
+				self.deadline = time.perf_counter() + self.timeBudget / 1000
+			self.createTree(None, 0, speculation.knownPieces)
+			knownLevel = self.deepestLevel
+			knownDepth = self.completedDepth
+			knownCount = self.tree.count
+			if speculation.cancelled:
+				return
+			if knownDepth < len(speculation.knownPieces):
+				result = (self.chooseMove(), knownDepth)
+				for pieceType in PLACEMENT_TABLE:
+					speculation.results[pieceType] = result
+				return
+			for pieceType in PLACEMENT_TABLE:
+				if speculation.cancelled:
+					break
+				self.tree.truncate(knownCount)
+				self.completedDepth = knownDepth
+				if self.timeBudget is not None:
+					self.deadline = time.perf_counter() + self.timeBudget / 1000
+				self.deepestLevel = self.expandLevels(knownLevel, [pieceType])
+				speculation.results[pieceType] = (self.chooseMove(), self.completedDepth)
+				speculation.ready[pieceType].set()
+		except Exception:
+			speculation.failed = True
+			raise
+		finally:
+			for event in speculation.ready.values():
+				event.set()
+			self.deepestLevel = []
+			self.searchedSpeculation = None
+
+
+	def takeSpeculation(self):
+		"""
+		Returns the current piece's placement node from the background search if its prediction held: same board and same pieces.
+		Waits for the search of the piece ending the queue if it is not done yet, then stops the thread.
+		With a time budget it only waits for half the time left before the deadline, leaving the rest to search without it.
+		Returns None when there is no speculation, it was wrong, or its result is not there in time.
+		"""
+		speculation = self.speculation
+		self.speculation = None
+		if speculation is None:
+			return None
+		pieceTypes = [self.movingPiece.type] + self.nextPieces[1:self.maxTreeDepth]
+		ready = False
+		if self.boardRows == speculation.rows and pieceTypes[:-1] == speculation.knownPieces:
+			timeout = None
+			if self.timeBudget is not None:
+				timeout = max(0.0, (self.deadline - time.perf_counter()) / 2)
+			ready = speculation.ready[pieceTypes[-1]].wait(timeout)
+		speculation.cancelled = True # the thread stops at its next batch of nodes
+		if not ready or speculation.failed or pieceTypes[-1] not in speculation.results:
+			if self.timeBudget is not None:
+				speculation.thread.join() # so the search replacing it does not share the interpreter with it
+			self.speculationMisses += 1
+			return None
+		node, self.completedDepth = speculation.results[pieceTypes[-1]]
+		self.speculationHits += 1
+		return node
+
+	
+	def runBatch(self, boards, nextPieces, weights=None):
+		"""
+		Chooses the current piece's placement in many games at once, with the same search and choices as run() on the numpy backend.
+		boards is a (N, rows, cols) array of 0 and 1 cells, and nextPieces[i] is game i's current piece followed by its preview queue.
+		weights optionally gives each game its own weights as an (N, features) array, in the order of setWeights().
+		Each depth of every game's tree is expanded and evaluated together, BATCH_CHUNK_SIZE parent nodes per evaluateBatch() call on a 10x20 board.
+		Returns the orientations and columns of the chosen placements as two arrays, like getPlacement().
+		"""
+		gameNum, rowNum, colNum = boards.shape
+		typeIndex = {pieceType: i for i, pieceType in enumerate(PLACEMENT_TABLE)}
+		depthNum = len(nextPieces[0])
+		pieceTypes = np.array([[typeIndex[pieceType] for pieceType in queue[:depthNum]] for queue in nextPieces]).reshape(gameNum, depthNum)
+		if weights is not None:
+			weights = np.asarray(weights, dtype=float)
+		maxChildren = max(getPlacementArrays(pieceType, colNum).count for pieceType in PLACEMENT_TABLE)
+		chunkSize = max(1, BATCH_CHUNK_SIZE * 34 * 200 // (maxChildren * rowNum * colNum)) # children's boards take as many cells as on a 10x20 board
+
+		# the current level of every tree, as flat arrays of nodes kept in the order run() visits them within each game
+		games = np.arange(gameNum)
+		levelBoards = boards
+		filled = boards != 0
+		heights = np.where(filled.any(axis=1), rowNum - filled.argmax(axis=1), 0)
+		evaluations = np.zeros(gameNum)
+		orientations = np.zeros(gameNum, dtype=int) # placement of the depth 1 ancestor
+		cols = np.zeros(gameNum, dtype=int)
+
+		for depth in range(depthNum):
+			if self.beamWidth is not None:
+				counts = np.bincount(games, minlength=gameNum)
+				pruned = counts[games] > self.beamWidth
+				if pruned.any():
+					# like createTree, the best beamWidth nodes of larger levels are kept in evaluation order, others keep their order
+					order = np.lexsort((np.arange(len(games)), np.where(pruned, evaluations, 0), games))
+					starts = np.searchsorted(games[order], games[order])
+					order = order[np.arange(len(order)) - starts < self.beamWidth]
+					games, levelBoards, heights, evaluations, orientations, cols = games[order], levelBoards[order], heights[order], evaluations[order], orientations[order], cols[order]
+
+			lastDepth = depth == depthNum - 1
+			parts = []
+			for start in range(0, len(games), chunkSize):
+				parts.append(self.expandBatch(games[start:start + chunkSize], levelBoards[start:start + chunkSize], heights[start:start + chunkSize],
+					orientations[start:start + chunkSize], cols[start:start + chunkSize], pieceTypes[:, depth], depth == 0, lastDepth, weights))
+			games, levelBoards, heights, evaluations, orientations, cols = (np.concatenate([part[i] for part in parts]) if parts[0][i] is not None else None for i in range(6))
+
+		# like chooseBest, the first leaf of each game with the lowest evaluation below 10000
+		order = np.lexsort((np.arange(len(games)), evaluations, games))
+		first = order[np.searchsorted(games[order], np.arange(gameNum))]
+		chosen = evaluations[first] < 10000
+		return np.where(chosen, orientations[first], 0), np.where(chosen, cols[first], 0)
+
+
+	def expandBatch(self, games, boards, heights, orientations, cols, pieceTypes, firstDepth, lastDepth, weights):
+		"""
+		Places every rotation and column of each node's piece on a chunk of nodes from runBatch() and evaluates all the children at once.
+		Children are returned in the order createNodes() builds them: by parent, then rotation, then column.
+		Returns the children's games, boards, heights, evaluations and depth 1 placements. Boards and heights are None on the last depth.
+		"""
+		rowNum, colNum = boards.shape[1:]
+		nodeTypes = pieceTypes[games]
+		pieceNames = list(PLACEMENT_TABLE)
+		placementNums = np.array([getPlacementArrays(pieceType, colNum).count for pieceType in pieceNames])
+		childNums = placementNums[nodeTypes]
+		childStarts = np.cumsum(childNums) - childNums
+		childNum = int(childNums.sum())
+		childParents = np.repeat(np.arange(len(games)), childNums)
+		childBoards = np.repeat(boards, childNums, axis=0)
+		childCellRows = np.empty((childNum, 4), dtype=int)
+		childOrientations = np.repeat(orientations, childNums)
+		childCols = np.repeat(cols, childNums)
+		for typeIndex, pieceType in enumerate(pieceNames):
+			group = np.flatnonzero(nodeTypes == typeIndex)
+			if len(group) == 0:
+				continue
+			# every placement of the group's piece on each of its nodes at once, as createNodes() builds them
+			placements = getPlacementArrays(pieceType, colNum)
+			children = childStarts[group][:, np.newaxis] + np.arange(placements.count)
+			cellRows = landingRows(heights, group, placements, rowNum)[:, :, np.newaxis] + placements.blockRows
+			parentIndex, placementIndex, blockIndex = np.nonzero(cellRows >= 0) # cells sticking out of the top are dropped
+			childBoards[children[parentIndex, placementIndex], cellRows[parentIndex, placementIndex, blockIndex], placements.blockCols[placementIndex, blockIndex]] = 1
+			childCellRows[children.ravel()] = cellRows.reshape(-1, 4)
+			if firstDepth:
+				childOrientations[children.ravel()] = np.tile(placements.orientations, len(group))
+				childCols[children.ravel()] = np.tile(placements.cols, len(group))
+
+		childGames = games[childParents]
+		childBoards, lines, childHeights, avgColumnHeights, bumpiness, holes, evaluations = self.evaluateBatch(childBoards, None if weights is None else weights[childGames],
+			childCellRows if self.usesPlacement else None)
+		if lastDepth:
+			childBoards = None
+			childHeights = None
+		return childGames, childBoards, childHeights, evaluations, childOrientations, childCols
+
+	
+	def getPlacement(self):
+		"""Returns the chosen placement as (orientation, col), the format taken by GameEngine.step()."""
+		return (self.bestNode.orientation, self.bestNode.coords[1])
+
+	
+	def compilePlan(self):
+		"""Turns the chosen placement into the rotations movement() applies, so nothing is planned again while the piece moves."""
+		if self.bestNode.coords[1] < self.movingPiece.colNum // 2 and self.movingPiece.type == 'I':
+			self.rotationPlan = ['cCW'] * self.bestNode.orientation
+		else:
+			self.rotationPlan = ['CW'] * self.bestNode.orientation
+		self.targetBlockCol = None
 
 	
 	def movement(self, movingPiece):
-		"""Moves the current piece given the target position."""
+		"""
+		Moves the current piece given the target position, following the plan from compilePlan().
+		Rotations are applied in the first frame, then the piece is steered sideways to its column and held down.
+		With instantDrop the piece is shifted and hard dropped in that same frame.
+		"""
 		
-		# Rotate piece if necessary
-		while self.orientation != self.bestNode.orientation:
-			self.orientation += 1
-			if self.bestNode.coords[1] < 5 and movingPiece.type == 'I':
-				movingPiece.rotate('cCW')
-			else:
-				movingPiece.rotate('CW')
+		# Rotate piece, then find the column its first block has to reach from the leftmost block
+		if self.rotationPlan:
+			for rotationType in self.rotationPlan:
+				movingPiece.rotate(rotationType)
+			self.orientation = self.bestNode.orientation
+			self.rotationPlan = []
+		if self.targetBlockCol is None:
+			leftmostCol = min(block.currentPos.col for block in movingPiece.blocks)
+			self.targetBlockCol = movingPiece.blocks[0].currentPos.col + self.targetPosition[1] - leftmostCol
 		
-		# Find leftmost block in current piece
-		cols = []
-		for block in movingPiece.blocks:
-			cols.append(block.currentPos.col)
-		leftmostBlockCol = cols.index(min(cols))
+		col = movingPiece.blocks[0].currentPos.col
+		if self.instantDrop:
+			if movingPiece.status == 'moving':
+				direction = 'right' if col < self.targetBlockCol else 'left'
+				while movingPiece.blocks[0].currentPos.col != self.targetBlockCol and movingPiece.shift(direction):
+					pass
+				movingPiece.hardDrop()
+			return
 		
-		# Movement
-		if self.key.down.status == 'pressed':
-			self.key.down.status = 'released'
-		if movingPiece.blocks[leftmostBlockCol].currentPos.col < self.targetPosition[1]:
+		# Movement, sideways first and then held down
+		if col < self.targetBlockCol:
 			self.key.xNav.status = 'right'
-		elif movingPiece.blocks[leftmostBlockCol].currentPos.col > self.targetPosition[1]:
+			self.key.down.status = 'idle'
+		elif col > self.targetBlockCol:
 			self.key.xNav.status = 'left'
+			self.key.down.status = 'idle'
 		else:
-			# Slow down in certain cases, otherwise hold down
-			if self.bestNode.avgColumnHeight > 12 or (max(self.getColumnHeights(self.bestNode.data)) > 10 and movingPiece.type == 'I' and self.orientation == 1 and self.bestNode.coords[1] <= 1): # eyeballed values
-				self.key.xNav.status = 'idle'
-			else:
-				self.key.xNav.status = 'idle'
-				self.key.down.status = 'pressed'
+			self.key.xNav.status = 'idle'
+			self.key.down.status = 'pressed'
 	
 	
 	def getColumnHeights(self, data):
 		"""Returns a list of the column heights of the given board."""
+		if self.backend == 'bitboard':
+			return bitboard.columnHeights(data, self.boardArr.shape[1])
+		if kernels.jitEnabled:
+			return kernels.columnHeights(np.asarray(data)).tolist()
+
 		heights = []
 		# want to iterate through columns, so we transpose the data array
 		for row in np.transpose(data):
@@ -138,185 +437,451 @@ class Bot:
 					count += 1
 				else:
 					break
-			heights.append(20 - count)
+			heights.append(len(data) - count)
 			
 		return heights
 
 	
-	def createTree(self, root, depth):
-		"""Creates the tree of positions recursively. First creates depth 0, then depth 1."""
+	def createRoot(self):
+		"""Clears the search tree and adds the current board as its root. Returns the root's index."""
+		rowNum, colNum = self.boardArr.shape
+		bitboards = self.backend == 'bitboard'
+		if self.tree is None or self.tree.rowNum != rowNum or self.tree.colNum != colNum or self.tree.bitboards != bitboards:
+			self.tree = SearchTree(rowNum, colNum, bitboards)
+		tree = self.tree
+
+		data = list(self.boardRows) if bitboards else self.boardArr
+		columnHeights = self.getColumnHeights(data)
+		root = tree.addRoot(data, columnHeights)
+		if bitboards:
+			# cached for the incremental evaluation of the root's children
+			columnHoles = bitboard.columnHoles(data, colNum)
+			tree.columnHoles[root] = columnHoles
+			tree.holes[root] = sum(columnHoles)
+			tree.bumpiness[root] = sum(abs(columnHeights[i] - columnHeights[i+1]) for i in range(colNum - 1))
+		if self.transpositionTable is not None:
+			tree.zobrist[root] = self.hashBoard(data)
+		return root
+
+
+	def createTree(self, root, depth, pieceTypes=None):
+		"""
+		Creates the tree of positions one depth at a time, one depth per piece in the queue.
+		All the nodes of a depth are evaluated together, then only the best beamWidth of them are expanded into the next depth.\n
+		With a time budget this deepens iteratively: once the deadline passes, the depth being expanded is dropped
+		and the search ends on the last complete depth. The first depth is always completed so there is a placement to choose.\n
+		pieceTypes gives the piece of each depth, by default the current piece followed by the preview queue.
+		"""
 		
-		if depth == 2:
-			return
 		# Assigns the current root (newRoot)
 		if depth == 0:
-			newRoot = TreeNode(self.boardArr)
-			currentPiece = self.movingPiece
+			newRoot = self.createRoot()
 		else:
 			newRoot = root
-			currentPiece = self.nextPiece
 
-		self.createNodes(newRoot, currentPiece)
+		if pieceTypes is None:
+			pieceTypes = [self.movingPiece.type] + self.nextPieces[1:self.maxTreeDepth]
+		self.completedDepth = depth
+		self.deepestLevel = self.expandLevels(np.array([newRoot]), pieceTypes[depth:])
 
-		# Forms self.searchTree
-		for childNode in newRoot.children:
-			self.createTree(childNode, depth+1)
-		
-		self.searchTree = newRoot
+
+	def expandLevels(self, level, pieceTypes):
+		"""
+		Expands the nodes of a level, an array of node indices at depth completedDepth, one depth per piece type of pieceTypes as createTree() does.
+		Children are built and evaluated in batches of scratch boards, and only the boards of the nodes expanded next are rebuilt and kept,
+		so memory stays bounded on large boards. Levels that fit in SCRATCH_CELLS keep their boards instead. Returns the deepest level completed.
+		"""
+		tree = self.tree
+		measured = False
+		for n, pieceType in enumerate(pieceTypes):
+			if self.beamWidth is not None and len(level) > self.beamWidth:
+				level = level[np.argsort(tree.evaluation[level], kind='stable')[:self.beamWidth]]
+			self.restoreBoards(level)
+			start = tree.count
+			placementNum = getPlacementArrays(pieceType, tree.colNum).count
+			if self.deadline is not None:
+				# expands and evaluates about EVAL_CHUNK_SIZE children at a time, and a batch only starts if it is predicted to end before the deadline
+				groupSize = max(1, EVAL_CHUNK_SIZE // placementNum)
+			else:
+				groupSize = max(1, SCRATCH_CELLS // (placementNum * tree.rowNum * tree.colNum))
+			keep = n < len(pieceTypes) - 1 and len(level) * placementNum * tree.rowNum * tree.colNum <= SCRATCH_CELLS
+			timedOut = False
+			for first in range(0, len(level), groupSize):
+				parents = level[first:first + groupSize]
+				chunkStart = time.perf_counter()
+				# small batches, like the first depth's or the end of a level, mostly cost what any batch does, so are priced as half a full one
+				estimate = CHUNK_COST_MARGIN * self.nodeSeconds * max(len(parents) * placementNum, EVAL_CHUNK_SIZE // 2)
+				cancelled = False
+				if self.searchedSpeculation is not None:
+					time.sleep(0) # a background search yields between batches, so a decision waiting for it gets the interpreter back within one
+					cancelled = self.searchedSpeculation.cancelled
+				if self.completedDepth > 0 and (cancelled or self.deadline is not None and chunkStart + estimate > self.deadline): # the first depth is always completed
+					timedOut = True
+					break
+				childStart = tree.count
+				self.evaluateNodes(self.createNodes(parents, pieceType, keep))
+				if not keep:
+					tree.releaseBoards(childStart, tree.count)
+				if self.deadline is not None and tree.count - childStart >= EVAL_CHUNK_SIZE // 2:
+					self.nodeSeconds = (time.perf_counter() - chunkStart) / (tree.count - childStart)
+					measured = True
+			if timedOut:
+				tree.truncate(start) # drops the unfinished depth
+				break
+			level = np.arange(start, tree.count)
+			self.completedDepth += 1
+		if self.deadline is not None and not measured:
+			self.nodeSeconds /= 2 # so one slow batch cannot keep later searches from ever running a batch to measure again
+		return level
 	
 	
-	def createNodes(self, root, currentPiece):
-		"""Feeds piece and board state at hand into generatePosition() in all orientations."""
-
-		# Find orientation count given type of piece
-		orientations = 0
-		if self.movingPiece.type == 'O':
-			orientations = 1
-		elif self.movingPiece.type == 'S' or self.movingPiece.type == 'Z' or self.movingPiece.type == 'I':
-			orientations = 2
+	def createNodes(self, parents, pieceType, keep=False):
+		"""
+		Adds the children of an array of parent nodes for every distinct rotation and column of the piece type,
+		in order of parent, then rotation, then column. The parents need their boards, and the children's go in scratch slots in the same order,
+		or in kept slots with keep.
+		Nodes found in the transposition table are filled from it. Returns the indices of the nodes that still need evaluating.
+		"""
+		tree = self.tree
+		placements = getPlacementArrays(pieceType, tree.colNum)
+		parentNum = len(parents)
+		start = tree.add(parentNum * placements.count)
+		end = tree.count
+		slot = tree.addBoards(end - start, keep)
+		tree.boardSlot[start:end] = np.arange(slot, slot + end - start)
+		rows = self.generatePosition(parents, placements)
+		tree.parent[start:end] = np.repeat(parents, placements.count)
+		tree.row[start:end] = rows.ravel()
+		tree.col[start:end] = np.tile(placements.cols, parentNum)
+		tree.orientation[start:end] = np.tile(placements.orientations, parentNum)
+		tree.blockRows[start:end] = np.tile(placements.blockRows, (parentNum, 1))
+		tree.blockCols[start:end] = np.tile(placements.blockCols, (parentNum, 1))
+		tree.rotation[start:end] = placements.rotations * parentNum
+
+		if self.backend != 'bitboard':
+			# every child's board at once: copies of the parent boards, then the piece blocks inside the board are set
+			boards = tree.boards[slot:slot + end - start].reshape(parentNum, placements.count, tree.rowNum, tree.colNum)
+			boards[:] = tree.boards[tree.boardSlot[parents]][:, np.newaxis]
+			cellRows = rows[:, :, np.newaxis] + placements.blockRows
+			parentIndex, placementIndex, blockIndex = np.nonzero(cellRows >= 0)
+			boards[parentIndex, placementIndex, cellRows[parentIndex, placementIndex, blockIndex], placements.blockCols[placementIndex, blockIndex]] = 1
+
+		if self.transpositionTable is None:
+			pending = range(start, end)
 		else:
-			orientations = 4
-		
-		# Get list of target positions for piece at hand
-		targetPositions = []
-		orientationMap = {}
-		for orientation in range(orientations):
-			newPositions = self.generatePosition(root, currentPiece)
-			targetPositions += newPositions
-			orientationMap[len(targetPositions) - len(newPositions)] = [orientation, copy.deepcopy(currentPiece.currentDef)]
-			currentPiece.rotate('CW')
-
-		# Create nodes
-		mappedOrientation = 0
-		currentKey = 0
-		for i, tar in enumerate(targetPositions):
-			if i in orientationMap.keys():
-				mappedOrientation = orientationMap[i][0]
-				currentKey = i
-
-			newNodeData = copy.deepcopy(root.data)
-			for pos in orientationMap[currentKey][1]:
-				if tar in targetPositions:
-					newNodeData[tar[0] + pos[0]][tar[1] + pos[1]] = 1
-
-			newNode = TreeNode(newNodeData)
-			newNode.coords = tar
-			newNode.orientation = mappedOrientation
-			newNode.evaluation = self.objFunc(newNode)
-			root.children.append(newNode)
-			newNode.parent = root
+			pending = []
+			rowList = rows.ravel().tolist()
+			i = start
+			for parent in parents.tolist():
+				parentZobrist = tree.zobrist[parent]
+				for p in range(placements.count):
+					row = rowList[i - start]
+					tree.zobrist[i] = None
+					# Pieces that stick out of the top are not hashed, as they can overlap filled cells
+					if parentZobrist is not None and row >= 0:
+						tree.zobrist[i] = parentZobrist ^ self.zobristKeys.hashPiece(placements.rotations[p].pieceDef, row, placements.cols[p])
+						cached = self.transpositionTable.get(tree.zobrist[i])
+						if cached is not None:
+							tree.setValues(i, cached)
+							i += 1
+							continue
+					pending.append(i)
+					i += 1
 
-		
-	
-	def generatePosition(self, root, currentPiece):
-		"""Generates all possible positions given the piece and board state at hand."""
-		
-		targetPositions = []
-		defPositions = currentPiece.currentDef
-		defRows = [x[0] for x in defPositions]
-		defCols = [x[1] for x in defPositions]
-		# if there's a gap in row 0 of definition
-		while 0 not in defRows:
-			for pos in defPositions:
-				pos[0] -= 1
-			defRows = [x[0] for x in defPositions]
-		# if there's a gap in column 0 of definition
-		while 0 not in defCols:
-			for pos in defPositions:
-				pos[1] -= 1
-			defCols = [x[1] for x in defPositions]
-		colCount = 10 - max(defCols)
-		
-		
-		for j in range(colCount):
-			for i in range(20):
-				target = False
-				startPos = (i, j)
-
-				for pos in defPositions:
-					if startPos[0] + pos[0] >= 20:
-						target = True
-						targetPositions.append([i-1, j])
-						break
-					if startPos[1] + pos[1] >= 10:
-						target = True
-						targetPositions.append([i, j-1])
-					if root.data[startPos[0] + pos[0]][startPos[1] + pos[1]] == 0:
-						continue
-					else:
-						target = True
-						targetPositions.append([i-1, j]) # previous start position
-						break
-				
-				if target:
-					break
+		if self.backend == 'bitboard':
+			rowList = rows.ravel().tolist()
+			parentSlots = tree.boardSlot[parents].tolist()
+			for i in pending:
+				parent, p = divmod(i - start, placements.count)
+				tree.boards[slot + i - start] = bitboard.place(tree.boards[parentSlots[parent]], placements.masks[p], rowList[i - start])
+		return pending
+
+
+	def restoreBoards(self, nodes):
+		"""
+		Rebuilds the boards of the nodes of an array that have none, from their parent's board, and keeps them.
+		The piece is placed again and full lines removed, giving the board the node was evaluated on.
+		"""
+		tree = self.tree
+		nodes = nodes[tree.boardSlot[nodes] < 0]
+		if not len(nodes):
+			return
+		slot = tree.addBoards(len(nodes), True)
+		slots = np.arange(slot, slot + len(nodes))
+		parentSlots = tree.boardSlot[tree.parent[nodes]]
+		tree.boardSlot[nodes] = slots
+		if self.backend == 'bitboard':
+			for i, childSlot, parentSlot in zip(nodes.tolist(), slots.tolist(), parentSlots.tolist()):
+				rows = bitboard.place(tree.boards[parentSlot], tree.rotation[i].getMasks(int(tree.col[i])), int(tree.row[i]))
+				tree.boards[childSlot] = bitboard.clearLines(rows, tree.colNum)[0]
+			return
+		boards = tree.boards[slot:slot + len(nodes)]
+		boards[:] = tree.boards[parentSlots]
+		cellRows = tree.row[nodes, np.newaxis] + tree.blockRows[nodes]
+		inside = cellRows >= 0
+		boards[np.nonzero(inside)[0], cellRows[inside], tree.blockCols[nodes][inside]] = 1
+		clearBoards(boards)
 
-		return targetPositions
+	
+	def generatePosition(self, parents, placements):
+		"""
+		Generates the landing row of every placement of placements.PlacementArrays on each node of an array of parents.
+		The rows are found from the parents' column heights instead of scanning the boards, by placements.landingRows() or kernels.landingRows().
+		Returns a (parents, placements) array of rows, -1 where the piece collides at row 0.
+		"""
+		return landingRows(self.tree.columnHeights, parents, placements, self.tree.rowNum)
 	
 	
 	def chooseBest(self):
-		"""Chooses the best node in depth 2 of self.searchTree."""
-		bestEvaluation = 10000
-		bestChild = TreeNode(None)
-
-		for child in self.searchTree.children:
-			for grandchild in child.children:
-				if grandchild.evaluation < bestEvaluation:
-					bestEvaluation = grandchild.evaluation
-					bestChild = grandchild
-		
-		return bestChild
+		"""Returns the index of the best node in the deepest depth of the search tree, or -1 if none evaluates below 10000."""
+		if len(self.deepestLevel) == 0:
+			return -1
+		evaluations = self.tree.evaluation[self.deepestLevel]
+		best = evaluations.argmin()
+		if evaluations[best] >= 10000:
+			return -1
+		return self.deepestLevel[best]
+
+	
+	def evaluateNodes(self, nodes):
+		"""
+		Evaluates the nodes of a list or range of indices, all at once with evaluateBatch() for the numpy backend.
+		Otherwise nodes are evaluated one by one, incrementally from their parent's column heights and holes.
+		That only knows the default features, so bitboards scored with other features go through evaluateBatch() as arrays.
+		The results are stored in the transposition table.
+		"""
+		if not len(nodes):
+			return
+		tree = self.tree
+
+		if isinstance(nodes, range):
+			index = slice(nodes.start, nodes.stop) # the boards are evaluated in place
+		else:
+			index = np.array(nodes)
+		slots = tree.boardSlot[index]
+		cellRows = tree.row[index, np.newaxis] + tree.blockRows[index] if self.usesPlacement else None
+		if self.backend == 'bitboard' and self.features != DEFAULT_FEATURES:
+			slots = slots.tolist()
+			boards = bitboard.toArrays([tree.boards[slot] for slot in slots], tree.colNum)
+			boards, lines, heights, avgColumnHeights, bumpiness, holes, evaluations = self.evaluateBatch(boards, None, cellRows)
+			for slot, rows in zip(slots, bitboard.fromArrays(boards)):
+				tree.boards[slot] = rows
+			tree.columnHoles[index] = (np.logical_or.accumulate(boards != 0, axis=1) & (boards == 0)).sum(axis=1)
+		elif self.backend == 'bitboard':
+			slots = slots.tolist()
+			results = []
+			parents = tree.parent[index].tolist()
+			rows = tree.row[index].tolist()
+			cols = tree.col[index].tolist()
+			lastParent = -1
+			for n, i in enumerate(nodes):
+				if rows[n] < 0:
+					results.append(self.objFunc(tree.boards[slots[n]]))
+					continue
+				if parents[n] != lastParent:
+					lastParent = parents[n]
+					parent = (tree.columnHeights[lastParent].tolist(), tree.columnHoles[lastParent].tolist(), int(tree.bumpiness[lastParent]), int(tree.holes[lastParent]))
+				results.append(self.objFuncIncremental(tree.boards[slots[n]], parent, tree.rotation[i], rows[n], cols[n]))
+			boards, lines, heights, columnHoles, avgColumnHeights, bumpiness, holes, evaluations = zip(*results)
+			for n, slot in enumerate(slots):
+				tree.boards[slot] = boards[n]
+			tree.columnHoles[index] = columnHoles
+		elif isinstance(index, slice):
+			# slots of a range of children are consecutive too
+			boards, lines, heights, avgColumnHeights, bumpiness, holes, evaluations = self.evaluateBatch(tree.boards[slots[0]:slots[-1] + 1], None, cellRows)
+		else:
+			boards, lines, heights, avgColumnHeights, bumpiness, holes, evaluations = self.evaluateBatch(tree.boards[slots], None, cellRows)
+			tree.boards[slots] = boards
+		tree.lines[index] = lines
+		tree.columnHeights[index] = heights
+		tree.avgColumnHeight[index] = avgColumnHeights
+		tree.bumpiness[index] = bumpiness
+		tree.holes[index] = holes
+		tree.evaluation[index] = evaluations
+
+		if self.transpositionTable is not None:
+			for i in nodes:
+				if tree.zobrist[i] is not None:
+					self.cacheNode(i)
+
+
+	def hashBoard(self, data):
+		"""Returns the Zobrist hash of a search board, creating the keys when the board size changes."""
+		rowNum = len(data)
+		colNum = self.boardArr.shape[1]
+		if self.zobristKeys is None or self.zobristKeys.rowNum != rowNum or self.zobristKeys.colNum != colNum:
+			self.zobristKeys = ZobristKeys(rowNum, colNum)
+			self.transpositionTable.clear()
+		if self.backend == 'bitboard':
+			return self.zobristKeys.hashRows(data)
+		return self.zobristKeys.hashBoard(data)
+
+
+	def cacheNode(self, index):
+		"""Stores an evaluated node under the hash of its board before lines were removed, then rehashes it if they were."""
+		tree = self.tree
+		key = tree.zobrist[index]
+		if tree.lines[index]:
+			tree.zobrist[index] = self.hashBoard(tree.getBoard(index))
+		values = tree.getValues(index) # a copy, so the cache does not keep the tree's arrays alive
+		self.transpositionTable.put(key, values, values[0], values[2])
 
 	
-	def objFunc(self, node : TreeNode):
+	def evaluateBatch(self, boards, weights=None, cellRows=None):
 		"""
-		Evaluates a given node by assigning a score based on the following metrics:
-		line completion, average height, bumpiness, and hole count.
+		Evaluates a stack of boards shaped (N, rows, cols) with the bot's features, over the whole stack with NumPy reductions or the compiled kernels.
+		All the features are computed from one BoardStats, so the intermediates they share are only computed once.
+		Returns the boards with lines removed, then the line bonus, column heights, average height, bumpiness, hole count and evaluation of each board.
+		weights optionally gives each board its own weights as an (N, features) array, in the order of setWeights().
+		cellRows optionally gives the (N, 4) rows of the blocks of the piece placed on each board, for the features that use it.
 		"""
+		stats = BoardStats(boards, cellRows if self.usesPlacement else None)
+		if kernels.jitEnabled:
+			measures = kernels.evaluateBoards(boards, self.usesScan)
+			stats.setMeasures(*measures[:4])
+			if self.usesScan:
+				stats.scanResults = measures[4:]
+		else:
+			stats.measure()
+		evaluations = scoreFeatures(stats.getMatrix(self.featureList), self.weights if weights is None else weights)
+		return boards, stats.lines, stats.heights, stats.avgColumnHeights, stats.bumpiness, stats.holes, evaluations
+
+	
+	def objFunc(self, data):
+		"""
+		Evaluates a given board by assigning a score based on the following metrics:
+		line completion, average height, bumpiness, and hole count.\n
+		Returns the board with lines removed, then the line bonus, column heights, column holes (None for the numpy backend),
+		average height, bumpiness, hole count and evaluation.
+		Boards scored with other features than the default ones are evaluated by evaluateBatch() instead.
+		"""
+		if self.features != DEFAULT_FEATURES:
+			return self.objFuncFeatures(data)
 
 		# LINE COMPLETION
 		lineCount = 0
-		for i, row in enumerate(node.data):
-			if all(j == 1 for j in row):
-				lineCount += 1
-				node.data = np.delete(node.data, i, 0)
-				node.data = np.insert(node.data, 0, np.array((0,0,0,0,0,0,0,0,0,0)), 0) # removes lines
+		if self.backend == 'bitboard':
+			data, lineCount = bitboard.clearLines(data, self.boardArr.shape[1])
+		elif kernels.jitEnabled:
+			data = np.array(data)
+			lineCount = kernels.clearLines(data)
+		else:
+			for i, row in enumerate(data):
+				if all(j == 1 for j in row):
+					lineCount += 1
+					data = np.delete(data, i, 0)
+					data = np.insert(data, 0, np.zeros(data.shape[1]), 0) # removes lines
 		if lineCount == 2:
 			lineCount = 2.5
 		elif lineCount == 3:
 			lineCount = 7.5
 		elif lineCount == 4:
 			lineCount = 30
-		node.lines = lineCount
+		lines = lineCount
 
 		# AVERAGE HEIGHT
-		self.columnHeights = self.getColumnHeights(node.data)
-		node.avgColumnHeight = sum(self.columnHeights) / len(self.columnHeights)
+		columnHeights = self.getColumnHeights(data)
+		avgColumnHeight = sum(columnHeights) / len(columnHeights)
 
 		# BUMPINESS
-		for i in range(len(self.columnHeights) - 1):
-			node.bumpiness += abs(self.columnHeights[i] - self.columnHeights[i+1])
+		bumpiness = 0
+		for i in range(len(columnHeights) - 1):
+			bumpiness += abs(columnHeights[i] - columnHeights[i+1])
 
 		# HOLES
 		holeCount = 0
-		holeCounting = False
-		for row in np.transpose(node.data):
-			for val in row:
-				if val == 0 and not holeCounting:
-					continue
-				if val != 0:
-					holeCounting = True
-				if val == 0 and holeCounting:
-					holeCount += 1
+		columnHoles = None
+		if self.backend == 'bitboard':
+			columnHoles = bitboard.columnHoles(data, len(columnHeights))
+			holeCount = sum(columnHoles)
+		elif kernels.jitEnabled:
+			holeCount = kernels.holeCount(data)
+		else:
 			holeCounting = False
-		
-		node.holes = holeCount
+			for row in np.transpose(data):
+				for val in row:
+					if val == 0 and not holeCounting:
+						continue
+					if val != 0:
+						holeCounting = True
+					if val == 0 and holeCounting:
+						holeCount += 1
+				holeCounting = False
+
+		avgHeightWeight, bumpinessWeight, holesWeight, lineWeight = self.weights
+		evaluation = avgColumnHeight*avgHeightWeight + bumpiness*bumpinessWeight + holeCount*holesWeight + lines*lineWeight
+		return data, lines, columnHeights, columnHoles, avgColumnHeight, bumpiness, holeCount, evaluation
 
-		return node.avgColumnHeight*self.avgHeightWeight + node.bumpiness*self.bumpinessWeight + node.holes*self.holesWeight + node.lines*self.lineWeight
+
+	def objFuncFeatures(self, data):
+		"""objFunc() for boards scored with other features than the default ones, as a stack of one board for evaluateBatch()."""
+		colNum = self.boardArr.shape[1]
+		board = np.array(bitboard.toArray(data, colNum) if self.backend == 'bitboard' else data, dtype=np.int8)
+		boards, lines, heights, avgColumnHeights, bumpiness, holes, evaluations = self.evaluateBatch(board[np.newaxis])
+		columnHoles = None
+		if self.backend == 'bitboard':
+			data = bitboard.fromArray(boards[0])
+			columnHoles = bitboard.columnHoles(data, colNum)
+		else:
+			data = boards[0]
+		return data, float(lines[0]), heights[0].tolist(), columnHoles, float(avgColumnHeights[0]), int(bumpiness[0]), int(holes[0]), float(evaluations[0])
+
+	
+	def objFuncIncremental(self, data, parent, rotation, row, col):
+		"""
+		Evaluates a bitboard with the same metrics as objFunc(), derived from its parent's cached column heights and holes.
+		parent is the parent's (column heights, column holes, bumpiness, holes), and the piece placed on it has its top at row and leftmost column at col.
+		Only the columns under the placed piece change. Cleared lines shift rows, so those boards go through objFunc() instead.
+		Returns the same values as objFunc().
+		"""
+		parentHeights, parentColumnHoles, bumpiness, holeCount = parent
+		rowNum = len(data)
+		colNum = len(parentHeights)
+
+		# LINE COMPLETION, only the rows the piece filled can be complete
+		full = (1 << colNum) - 1
+		for offset in range(rotation.height):
+			if data[row + offset] == full:
+				return self.objFunc(data)
+
+		heights = list(parentHeights)
+		columnHoles = list(parentColumnHoles)
+		first = max(col - 1, 0) # neighbour pairs whose height difference can change
+		last = min(col + rotation.width, colNum - 1)
+		for i in range(first, last):
+			bumpiness -= abs(heights[i] - heights[i+1])
+
+		for j in range(rotation.width):
+			# the cells between the piece's lowest block and the old top of the column become holes
+			newHoles = (rowNum - heights[col + j]) - (row + rotation.bottoms[j]) - 1
+			columnHoles[col + j] += newHoles
+			holeCount += newHoles
+			heights[col + j] = rowNum - (row + rotation.tops[j])
+
+		for i in range(first, last):
+			bumpiness += abs(heights[i] - heights[i+1])
+
+		# AVERAGE HEIGHT, BUMPINESS, HOLES
+		avgColumnHeight = sum(heights) / len(heights)
+
+		evaluation = avgColumnHeight*self.weights[0] + bumpiness*self.weights[1] + holeCount*self.weights[2]
+		return data, 0, heights, columnHoles, avgColumnHeight, bumpiness, holeCount, evaluation
+
+	
+	def renderBoard(self, miniBoard):
+		"""Returns the mini-board array as a pygame Surface scaled to fit MINI_BOARD_SIZE, coloured with MINI_BOARD_PALETTE."""
+		pixels = MINI_BOARD_PALETTE[miniBoard].transpose(1, 0, 2) # surfarray indexes pixels as [x][y]
+		rowNum, colNum = miniBoard.shape
+		cellSize = min(MINI_BOARD_SIZE[0] / colNum, MINI_BOARD_SIZE[1] / rowNum)
+		return pygame.transform.scale(pygame.surfarray.make_surface(pixels), (round(colNum * cellSize), round(rowNum * cellSize)))
 
 	
 	def drawBoard(self, gameDisplay):
-		"""Draws a simplified board, which shows the target position for the current piece."""
-		boardImage = pygame.image.load("images/board.png")
-		boardImage = pygame.transform.scale(boardImage, [100,200])
-		gameDisplay.blit(boardImage, [680, 380])
+		"""
+		Draws a simplified board, which shows the target position for the current piece.
+		It is only rendered and drawn once per decision. Returns the list of rects drawn, for pygame.display.update.
+		"""
+		if self.miniBoard is None or self.miniBoardSurface is not None:
+			return []
+		self.miniBoardSurface = self.renderBoard(self.miniBoard)
+		return [gameDisplay.blit(self.miniBoardSurface, MINI_BOARD_POS)]
@@ -0,0 +1,268 @@
+"""
+Board features the bot scores positions with, kept in a registry by name.
+A feature is a function of a BoardStats, which holds the intermediates features share (filled cells, column heights,
+holes) for a whole stack of boards and computes each of them once. Selecting more features adds one reduction
+per feature over those arrays instead of another pass over every board.
+
+Bot(features=...) picks the features, and setWeights() takes one weight per feature in the same order.
+python features.py checks that the features without usesPlacement play the same games with and without the bot's transposition table.
+
+New features are registered with the decorator:
+
+@registerFeature('filledCells')
+def filledCells(stats):
+	return stats.filled.sum(axis=(1, 2))
+"""
+import sys
+import numpy as np
+import kernels
+
+LINE_BONUSES = np.array((0, 1, 2.5, 7.5, 30)) # line completion value by the number of lines cleared at once
+
+class Feature:
+	"""A registered feature: computes one value per board of a BoardStats."""
+	def __init__(self, name, func, defaultWeight, usesPlacement, usesScan):
+		self.name = name
+		self.func = func
+		self.defaultWeight = defaultWeight # weight of the feature until setWeights() is called
+		self.usesPlacement = usesPlacement # needs the cells of the piece placed last, features are 0 without them
+		self.usesScan = usesScan # read from BoardStats.scan, found in the same pass as the other measures by the compiled kernel
+
+
+featureRegistry = {} # Feature by name
+
+def registerFeature(name, defaultWeight=0.0, usesPlacement=False, usesScan=False):
+	"""Decorator registering func(stats), returning an (N,) array, as the feature name."""
+	def register(func):
+		featureRegistry[name] = Feature(name, func, defaultWeight, usesPlacement, usesScan)
+		return func
+	return register
+
+
+def getFeatures(names):
+	"""Returns the Features of a list of names. Raises ValueError for names that are not registered."""
+	for name in names:
+		if name not in featureRegistry:
+			raise ValueError("Unknown feature %r, registered features are %s" % (name, ', '.join(featureRegistry)))
+	return [featureRegistry[name] for name in names]
+
+
+def clearBoards(boards, filled=None):
+	"""
+	Removes the full lines of a stack of boards in place. filled optionally gives boards != 0.
+	Returns the number of lines each board cleared and the indices of the boards that cleared some.
+	"""
+	rowNum = boards.shape[1]
+	if filled is None:
+		filled = boards != 0
+	full = filled.all(axis=2)
+	lineCount = full.sum(axis=1)
+	cleared = np.flatnonzero(lineCount)
+	if len(cleared):
+		# stable sort moves full rows to the top in order, then they are emptied. Only the boards with full rows are reordered, in place
+		order = np.argsort(~full[cleared], axis=1, kind='stable')
+		clearedBoards = np.take_along_axis(boards[cleared], order[:, :, np.newaxis], axis=1)
+		clearedBoards[np.arange(rowNum)[np.newaxis, :] < lineCount[cleared, np.newaxis]] = 0
+		boards[cleared] = clearedBoards
+	return lineCount, cleared
+
+
+class BoardStats:
+	"""
+	Intermediates of a stack of boards shaped (N, rows, cols), shared by the features.
+	Created before the full lines are removed, so cellRows, the (N, 4) rows of the blocks of the piece each board was
+	reached with, can tell which of them were cleared. Then measure(), or setMeasures() with the results of
+	kernels.evaluateBoards(), removes the lines and finds the line counts, column heights, bumpiness and holes.
+	The kernel can also scan the boards for the features with usesScan in that same pass.
+	Other intermediates are computed on first use.
+	"""
+	def __init__(self, boards, cellRows=None):
+		self.boards = boards
+		self.rowNum = boards.shape[1]
+		self.colNum = boards.shape[2]
+		self.cellRows = cellRows
+		self.clearedCells = None # blocks of the placed piece in full rows
+		if cellRows is not None:
+			inside = cellRows >= 0
+			full = boards[np.arange(len(boards))[:, np.newaxis], np.maximum(cellRows, 0)].all(axis=2)
+			self.clearedCells = (full & inside).sum(axis=1)
+		self.filledCells = None
+		self.coveredCells = None
+		self.scanResults = None
+
+	def measure(self):
+		"""Removes the full lines of the boards in place and measures them with NumPy reductions over the whole stack."""
+		filled = self.boards != 0
+		lineCount, cleared = clearBoards(self.boards, filled)
+		if len(cleared):
+			filled[cleared] = self.boards[cleared] != 0
+		self.filledCells = filled
+		heights = np.where(filled.any(axis=1), self.rowNum - filled.argmax(axis=1), 0)
+		covered = np.logical_or.accumulate(filled, axis=1)
+		self.coveredCells = covered
+		self.setMeasures(lineCount, heights, np.abs(np.diff(heights, axis=1)).sum(axis=1), (covered & ~filled).sum(axis=(1, 2)))
+
+	def setMeasures(self, lineCount, heights, bumpiness, holes):
+		"""Sets the measures of the boards once their lines are removed."""
+		self.lineCount = lineCount
+		self.heights = heights
+		self.bumpiness = bumpiness
+		self.holes = holes
+		self.lines = LINE_BONUSES[lineCount]
+		self.avgColumnHeights = heights.sum(axis=1) / heights.shape[1]
+
+	@property
+	def filled(self):
+		"""(N, rows, cols) mask of the filled cells."""
+		if self.filledCells is None:
+			self.filledCells = self.boards != 0
+		return self.filledCells
+
+	@property
+	def covered(self):
+		"""(N, rows, cols) mask of the cells with a filled cell at or above them."""
+		if self.coveredCells is None:
+			self.coveredCells = np.logical_or.accumulate(self.filled, axis=1)
+		return self.coveredCells
+
+	@property
+	def scan(self):
+		"""
+		Row transitions, column transitions and rows with holes of each board, as kernels.evaluateBoards() finds them.
+		Scanned on first use if the measures did not include them. None without the kernels, the features then use NumPy.
+		"""
+		if self.scanResults is None and kernels.jitEnabled:
+			self.scanResults = kernels.evaluateBoards(self.boards, True)[4:] # the lines are already removed
+		return self.scanResults
+
+	def getMatrix(self, features):
+		"""Returns the (N, features) matrix of the values of a list of Features."""
+		return np.column_stack([feature.func(self) for feature in features])
+
+
+def scoreFeatures(matrix, weights):
+	"""
+	Returns the evaluation of each row of a feature matrix: one weight per feature, or an (N, features) array of weights per row.
+	Features are summed one at a time in order, so the four default features score exactly as they always have.
+	"""
+	weights = np.asarray(weights, dtype=float)
+	if weights.ndim == 1:
+		weights = weights[np.newaxis]
+	evaluations = matrix[:, 0] * weights[:, 0]
+	for k in range(1, matrix.shape[1]):
+		evaluations = evaluations + matrix[:, k] * weights[:, k]
+	return evaluations
+
+
+# The features of the original bot, with its tuned weights. Lower evaluations are better
+@registerFeature('avgHeight', 1.392)
+def avgHeight(stats):
+	return stats.avgColumnHeights
+
+@registerFeature('bumpiness', 0.861)
+def bumpiness(stats):
+	return stats.bumpiness
+
+@registerFeature('holes', 4.540)
+def holes(stats):
+	return stats.holes
+
+@registerFeature('lines', -0.193)
+def lines(stats):
+	return stats.lines
+
+DEFAULT_FEATURES = ('avgHeight', 'bumpiness', 'holes', 'lines')
+
+
+@registerFeature('maxHeight')
+def maxHeight(stats):
+	return stats.heights.max(axis=1)
+
+@registerFeature('wellDepth')
+def wellDepth(stats):
+	"""Summed depth of the columns lower than both neighbours, the walls counting as full columns."""
+	heights = stats.heights
+	neighbours = np.full_like(heights, stats.rowNum) # lower neighbour of each column
+	np.minimum(neighbours[:, 1:], heights[:, :-1], out=neighbours[:, 1:])
+	np.minimum(neighbours[:, :-1], heights[:, 1:], out=neighbours[:, :-1])
+	return np.maximum(neighbours - heights, 0).sum(axis=1)
+
+@registerFeature('rowTransitions', usesScan=True)
+def rowTransitions(stats):
+	"""Changes between filled and empty cells along each row, the walls counting as filled."""
+	if stats.scan is not None:
+		return stats.scan[0]
+	filled = stats.filled
+	transitions = (filled[:, :, 1:] != filled[:, :, :-1]).sum(axis=(1, 2))
+	return transitions + (~filled[:, :, 0]).sum(axis=1) + (~filled[:, :, -1]).sum(axis=1)
+
+@registerFeature('columnTransitions', usesScan=True)
+def columnTransitions(stats):
+	"""Changes between filled and empty cells down each column, the floor counting as filled."""
+	if stats.scan is not None:
+		return stats.scan[1]
+	filled = stats.filled
+	return (filled[:, 1:] != filled[:, :-1]).sum(axis=(1, 2)) + (~filled[:, -1]).sum(axis=1)
+
+@registerFeature('rowsWithHoles', usesScan=True)
+def rowsWithHoles(stats):
+	if stats.scan is not None:
+		return stats.scan[2]
+	return (stats.covered & ~stats.filled).any(axis=2).sum(axis=1)
+
+@registerFeature('erodedCells', usesPlacement=True)
+def erodedCells(stats):
+	"""Lines cleared times the blocks of the placed piece they removed."""
+	if stats.clearedCells is None:
+		return np.zeros(len(stats.boards))
+	return stats.lineCount * stats.clearedCells
+
+@registerFeature('landingHeight', usesPlacement=True)
+def landingHeight(stats):
+	"""Height of the middle of the placed piece above the floor, before lines are removed."""
+	if stats.cellRows is None:
+		return np.zeros(len(stats.boards))
+	return stats.rowNum - (stats.cellRows.min(axis=1) + stats.cellRows.max(axis=1) + 1) / 2
+
+
+def checkCaching(seeds=(0, 1), maxPieces=100, previewNum=3, cacheBytes=8 << 20, extraWeight=0.5):
+	"""
+	Plays seeded games with and without the transposition table, with the default features and then with every registered one
+	that does not use the placement, the features without a default weight weighted extraWeight so they count.
+	The table may only skip work, so the placements and scores must be identical. Placement features turn the table off,
+	which is checked as well. Returns a list of the differences found.
+	"""
+	from tetris import GameEngine, key
+	import bot
+
+	differences = []
+	placementFeatures = [name for name, feature in featureRegistry.items() if feature.usesPlacement]
+	if bot.Bot(cacheBytes=cacheBytes, features=placementFeatures).transpositionTable is not None:
+		differences.append('transposition table on with placement features')
+	boardFeatures = DEFAULT_FEATURES + tuple(name for name, feature in featureRegistry.items() if not feature.usesPlacement and name not in DEFAULT_FEATURES)
+	for features in (DEFAULT_FEATURES, boardFeatures):
+		for seed in seeds:
+			games = []
+			for size in (0, cacheBytes):
+				engine = GameEngine(seed=seed, previewNum=previewNum)
+				tBot = bot.Bot(cacheBytes=size, features=features)
+				tBot.setWeights([feature.defaultWeight or extraWeight for feature in tBot.featureList])
+				placements = []
+				while engine.gameStatus != 'gameOver' and engine.pieceCount < maxPieces:
+					tBot.update(engine.occupancy, engine.piece, engine.nextPieces, engine.gameStatus, key, engine.occupancyVersion)
+					tBot.run()
+					placements.append(tBot.getPlacement())
+					engine.step(placements[-1])
+				games.append((placements, engine.score))
+			if games[0] != games[1]:
+				differences.append('%d features, seed %d' % (len(features), seed))
+	return differences
+
+
+if __name__ == '__main__':
+	differences = checkCaching()
+	for difference in differences:
+		print("MISMATCH", difference)
+	if differences:
+		sys.exit(1)
+	print("cached and uncached games match")
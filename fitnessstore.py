@@ -0,0 +1,98 @@
+"""
+On-disk store of a GA training run, in a single SQLite file.
+Keeps the score of every fitness game played, keyed by (weights, seed, piece cap), so a game is never played twice,
+and a checkpoint of the population after every generation, so a stopped run resumes where it left off.
+Scores depend on the bot's settings as well, so a store belongs to one bot configuration.
+
+store = FitnessStore('training.db')
+store.resume(ga_instance) # before ga_instance.run()
+"""
+import pickle
+import random
+import sqlite3
+import numpy as np
+
+UNCAPPED = -1 # piece cap stored for games played to game over
+
+class FitnessStore:
+	"""Game scores and GA checkpoints of a training run, in the SQLite file at path. The file is created if needed."""
+	def __init__(self, path):
+		self.path = path
+		self.connection = sqlite3.connect(path)
+		self.connection.execute('CREATE TABLE IF NOT EXISTS games (weights TEXT, seed INTEGER, maxPieces INTEGER, score INTEGER, PRIMARY KEY (weights, seed, maxPieces))')
+		self.connection.execute('CREATE TABLE IF NOT EXISTS checkpoints (generation INTEGER PRIMARY KEY, population BLOB, fitness BLOB, randomStates BLOB)')
+		self.connection.commit()
+		self.hits = 0
+		self.misses = 0
+
+
+	def getKey(self, solution, seed, maxPieces):
+		"""Returns the games table key of a game. Weights are kept as exact float reprs."""
+		return ','.join(repr(float(weight)) for weight in solution), seed, UNCAPPED if maxPieces is None else maxPieces
+
+
+	def getScore(self, solution, seed, maxPieces):
+		"""Returns the stored score of a game, or None if it was not played yet. Counts a hit or a miss."""
+		row = self.connection.execute('SELECT score FROM games WHERE weights = ? AND seed = ? AND maxPieces = ?', self.getKey(solution, seed, maxPieces)).fetchone()
+		if row is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		return row[0]
+
+
+	def putScores(self, games, scores):
+		"""Stores the scores of a list of (solution, seed, maxPieces) games, and commits them."""
+		self.connection.executemany('INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?)', [self.getKey(*game) + (int(score),) for game, score in zip(games, scores)])
+		self.connection.commit()
+
+
+	def saveCheckpoint(self, ga_instance):
+		"""
+		Stores the GA's generation count, population, its fitness and the states of the random generators, and commits them.
+		Called from the GA's on_generation callback, once the generation's population was evaluated.
+		"""
+		self.connection.execute('INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)', (ga_instance.generations_completed,
+			pickle.dumps(np.array(ga_instance.population)), pickle.dumps(np.array(ga_instance.last_generation_fitness)), pickle.dumps(getRandomStates(ga_instance))))
+		self.connection.commit()
+
+
+	def resume(self, ga_instance):
+		"""
+		Sets the GA to the last stored checkpoint, if there is one, so run() plays only the generations left.
+		Fitness of the checkpoint's population is served from the stored games. Returns the generation resumed from, 0 when starting anew.
+		"""
+		row = self.connection.execute('SELECT generation, population, fitness, randomStates FROM checkpoints ORDER BY generation DESC LIMIT 1').fetchone()
+		if row is None:
+			return 0
+		generation, population, fitness, randomStates = row
+		ga_instance.population = pickle.loads(population)
+		ga_instance.last_generation_fitness = pickle.loads(fitness) # kept for best_solution() when no generation is left
+		ga_instance.generations_completed = generation
+		ga_instance.num_generations -= generation # run() goes on from generations_completed for num_generations more
+		setRandomStates(ga_instance, pickle.loads(randomStates))
+		return generation
+
+
+	def close(self):
+		self.connection.close()
+
+
+def getRandomStates(ga_instance):
+	"""Returns the states of the GA's own random generators, when its PyGAD version has them, and of the global ones."""
+	states = {'numpy': np.random.get_state(), 'python': random.getstate()}
+	if hasattr(ga_instance, 'numpy_random_generator'):
+		states['gaNumpy'] = ga_instance.numpy_random_generator.get_state()
+	if hasattr(ga_instance, 'python_random_generator'):
+		states['gaPython'] = ga_instance.python_random_generator.getstate()
+	return states
+
+
+def setRandomStates(ga_instance, states):
+	"""Restores random generator states returned by getRandomStates()."""
+	np.random.set_state(states['numpy'])
+	random.setstate(states['python'])
+	if 'gaNumpy' in states:
+		ga_instance.numpy_random_generator.set_state(states['gaNumpy'])
+	if 'gaPython' in states:
+		ga_instance.python_random_generator.setstate(states['gaPython'])
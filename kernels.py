@@ -0,0 +1,226 @@
+"""
+Compiled kernels for the numpy backend of the bot's search: line clearing, column heights, holes, landing rows and the board scans of features.py.
+They are compiled with Numba when it is installed. Without it they stay plain Python and the bot uses its NumPy code instead.
+The kernels give the same values as the NumPy code, so the bot's decisions do not change.
+
+Numba kernels are on when Numba imports, unless TETRIS_JIT=0. setJit() switches them at runtime.
+python kernels.py checks the kernels against the NumPy code and compares seeded games played with and without them, and on a board too wide for 64 bit rows.
+"""
+import os
+import sys
+import numpy as np
+
+try:
+	import numba
+except ImportError:
+	numba = None
+
+JIT_AVAILABLE = numba is not None
+jitEnabled = JIT_AVAILABLE and os.environ.get('TETRIS_JIT', '1') == '1'
+
+def setJit(enabled):
+	"""Turns the compiled kernels on or off. Returns whether they are on, which they never are without Numba."""
+	global jitEnabled
+	jitEnabled = bool(enabled) and JIT_AVAILABLE
+	return jitEnabled
+
+
+def jit(func):
+	"""Compiles func with Numba when it is installed. Compiled code is cached next to the module."""
+	if numba is None:
+		return func
+	return numba.njit(cache=True)(func)
+
+
+@jit
+def clearLines(board):
+	"""Removes the full rows of a board in place, moving the rows above them down. Returns the number of rows removed."""
+	rowNum, colNum = board.shape
+	target = rowNum - 1 # row the next row that is not full is copied to, from the bottom up
+	for row in range(rowNum - 1, -1, -1):
+		full = True
+		for col in range(colNum):
+			if board[row, col] == 0:
+				full = False
+				break
+		if not full:
+			if target != row:
+				for col in range(colNum):
+					board[target, col] = board[row, col]
+			target -= 1
+	for row in range(target + 1):
+		for col in range(colNum):
+			board[row, col] = 0
+	return target + 1
+
+
+@jit
+def columnHeights(board):
+	"""Returns the column heights of a board, measured from the floor to the highest filled cell."""
+	rowNum, colNum = board.shape
+	heights = np.zeros(colNum, dtype=np.int64)
+	for col in range(colNum):
+		for row in range(rowNum):
+			if board[row, col] != 0:
+				heights[col] = rowNum - row
+				break
+	return heights
+
+
+@jit
+def holeCount(board):
+	"""Returns the number of empty cells that have a filled cell somewhere above them in their column."""
+	rowNum, colNum = board.shape
+	holes = 0
+	for col in range(colNum):
+		covered = False
+		for row in range(rowNum):
+			if board[row, col] != 0:
+				covered = True
+			elif covered:
+				holes += 1
+	return holes
+
+
+@jit
+def evaluateBoards(boards, scan=False):
+	"""
+	Clears the full rows of a (N, rows, cols) stack of boards in place.
+	Returns each board's number of cleared rows, column heights, bumpiness and hole count, as Bot.evaluateBatch() finds them,
+	then with scan its row transitions, column transitions and rows with holes, as the features of the same names in features.py find them.
+	Those are empty arrays without scan. Everything comes from one pass down each board.
+	"""
+	boardNum, rowNum, colNum = boards.shape
+	lineCounts = np.zeros(boardNum, dtype=np.int64)
+	heights = np.zeros((boardNum, colNum), dtype=np.int64)
+	bumpiness = np.zeros(boardNum, dtype=np.int64)
+	holes = np.zeros(boardNum, dtype=np.int64)
+	scanNum = boardNum if scan else 0
+	rowTransitions = np.zeros(scanNum, dtype=np.int64)
+	columnTransitions = np.zeros(scanNum, dtype=np.int64)
+	rowsWithHoles = np.zeros(scanNum, dtype=np.int64)
+	for n in range(boardNum):
+		board = boards[n]
+		lineCounts[n] = clearLines(board)
+		for row in range(rowNum):
+			previous = True # the left wall counts as filled
+			hasHole = False
+			for col in range(colNum):
+				filled = board[row, col] != 0
+				# a column's height is set at its highest filled cell, so empty cells below it are holes
+				if filled:
+					if heights[n, col] == 0:
+						heights[n, col] = rowNum - row
+				elif heights[n, col] != 0:
+					holes[n] += 1
+					hasHole = True
+				if scan:
+					if filled != previous:
+						rowTransitions[n] += 1
+					previous = filled
+					if row > 0 and filled != (board[row - 1, col] != 0):
+						columnTransitions[n] += 1
+			if scan:
+				if not previous: # and so does the right wall
+					rowTransitions[n] += 1
+				if hasHole:
+					rowsWithHoles[n] += 1
+		if scan:
+			for col in range(colNum):
+				if board[rowNum - 1, col] == 0: # and the floor
+					columnTransitions[n] += 1
+		for col in range(colNum - 1):
+			bumpiness[n] += abs(heights[n, col] - heights[n, col + 1])
+	return lineCounts, heights, bumpiness, holes, rowTransitions, columnTransitions, rowsWithHoles
+
+
+@jit
+def landingRows(heights, parents, columns, bottoms, rowNum):
+	"""
+	Returns the landing row of every placement on each parent node, as Bot.generatePosition() finds them.
+	heights holds the column heights of the nodes, and columns and bottoms come from a placements.PlacementArrays.
+	"""
+	rows = np.empty((len(parents), columns.shape[0]), dtype=np.int64)
+	for k in range(len(parents)):
+		for p in range(columns.shape[0]):
+			row = rowNum
+			for j in range(columns.shape[1]):
+				limit = rowNum - heights[parents[k], columns[p, j]] - 1 - bottoms[p, j]
+				if limit < row:
+					row = limit
+			rows[k, p] = max(row, -1)
+	return rows
+
+
+def checkParity(seeds=(0, 1, 2), maxPieces=150, previewNum=1, boardNum=2000, wideSize=(20, 70), widePieces=15):
+	"""
+	Checks that the kernels give the same results as the NumPy code: on random boards, then on seeded games whose
+	placements and scores must be identical with the kernels on and off. A shorter game on a wideSize (rows, cols) board,
+	too wide for a bitboard row to fit in 64 bits, must also match the bitboard backend. Returns a list of the differences found.
+	"""
+	from tetris import GameEngine, key
+	from features import BoardStats, featureRegistry, getFeatures
+	import bot
+
+	enabled = jitEnabled
+	differences = []
+	rng = np.random.default_rng(0)
+	boards = (rng.random((boardNum, 20, 10)) < rng.random((boardNum, 1, 1))).astype(np.int8)
+	boards[np.arange(boardNum)[:, np.newaxis], np.arange(20), rng.integers(0, 10, (boardNum, 20))] = 0 # a gap in every row
+	boards[::3, 12:16] = 1 # then full rows to clear, at most 4 as pieces can fill
+	boards[1::3, 18] = 1
+	cellRows = rng.integers(-1, 20, (boardNum, 4)) # rows of the blocks of a placed piece, for the features using them
+	tBot = bot.Bot()
+	try:
+		results = []
+		for enable in (False, True):
+			setJit(enable)
+			objFuncResults = [tBot.objFunc(board) for board in boards[:200]]
+			stats = BoardStats(boards.copy(), cellRows)
+			if enable:
+				measures = evaluateBoards(stats.boards, True)
+				stats.setMeasures(*measures[:4])
+				stats.scanResults = measures[4:]
+			else:
+				stats.measure()
+			results.append(tBot.evaluateBatch(boards.copy()) + (np.array([tBot.getColumnHeights(board) for board in boards]),
+				np.array([values[0] for values in objFuncResults]), [values[1:] for values in objFuncResults], stats.getMatrix(getFeatures(list(featureRegistry)))))
+		names = ('evaluateBatch boards', 'evaluateBatch lines', 'evaluateBatch heights', 'evaluateBatch avgColumnHeights', 'evaluateBatch bumpiness',
+			'evaluateBatch holes', 'evaluateBatch evaluations', 'getColumnHeights', 'objFunc boards', 'objFunc values', 'feature matrix')
+		for name, expected, value in zip(names, results[0], results[1]):
+			if not np.array_equal(expected, value) if isinstance(expected, np.ndarray) else expected != value:
+				differences.append(name)
+
+		def playGame(seed, rowNum, colNum, pieceNum, enable, backend='numpy'):
+			setJit(enable)
+			engine = GameEngine(colNum, rowNum, seed=seed, previewNum=previewNum)
+			tBot = bot.Bot(backend)
+			placements = []
+			while engine.gameStatus != 'gameOver' and engine.pieceCount < pieceNum:
+				tBot.update(engine.occupancy, engine.piece, engine.nextPieces, engine.gameStatus, key, engine.occupancyVersion)
+				tBot.run()
+				placements.append(tBot.getPlacement())
+				engine.step(placements[-1])
+			return placements, engine.score
+
+		for seed in seeds:
+			if playGame(seed, 20, 10, maxPieces, False) != playGame(seed, 20, 10, maxPieces, True):
+				differences.append('game with seed %d' % seed)
+		if wideSize is not None:
+			games = [playGame(seeds[0], *wideSize, widePieces, enable) for enable in (False, True)] + [playGame(seeds[0], *wideSize, widePieces, True, 'bitboard')]
+			if games[1] != games[0] or games[2] != games[0]:
+				differences.append('game on a %dx%d board' % wideSize)
+	finally:
+		setJit(enabled)
+	return differences
+
+
+if __name__ == '__main__':
+	if not JIT_AVAILABLE:
+		print("Numba is not installed, the kernels run as plain Python")
+	differences = checkParity()
+	for difference in differences:
+		print("MISMATCH", difference)
+	if differences:
+		sys.exit(1)
+	print("kernels match the NumPy code")
@@ -7,8 +7,9 @@ CPSC 476 - Artificial Intelligence
 
 from tetris import *
 import sys
-import copy
 import bot
+import recording
+from profiling import profiler
 	
 def gameLoop():		
 	"""Main loop that runs the game."""
@@ -22,13 +23,18 @@ def gameLoop():
 	boardPosX = DISPLAY_WIDTH*0.3
 	boardPosY = DISPLAY_HEIGHT*0.15
 
+	gameDisplay, clock = initDisplay()
 	mainBoard = MainBoard(blockSize,boardPosX,boardPosY,boardColNum,boardRowNum,boardLineWidth,blockLineWidth,scoreBoardWidth)	
 	
-	tBot = bot.Bot()
+	tBot = bot.Bot(speculative=True, instantDrop=INSTANT_DROP) # searches the next piece while the current one falls
 	
 	gameSpeed = 600
 	
+	recordPath = None #Set to a path like 'game-{game}.ttr' to write each game to a binary recording, see recording.py
+	gameCount = 0
+	
 	gameExit = False
+	windowExposed = False
 
 	while not gameExit: #Stay in this loop unless the game is quit
 		
@@ -47,6 +53,10 @@ def gameLoop():
 						key.restart.status = 'pressed'
 				if event.key == pygame.K_RETURN:
 					key.enter.status = 'pressed'
+				if event.key == pygame.K_SPACE: #Hard drops the falling piece
+					if key.hardDrop.status == 'idle':
+						key.hardDrop.trig = True
+						key.hardDrop.status = 'pressed'
 						
 			if event.type == pygame.KEYUP: #Keyboard keys release events
 				if event.key == pygame.K_p:
@@ -55,15 +65,25 @@ def gameLoop():
 					key.restart.status = 'idle'
 				if event.key == pygame.K_RETURN:
 					key.enter.status = 'idle'
+				if event.key == pygame.K_SPACE:
+					key.hardDrop.status = 'idle'
 			
+			if event.type == pygame.WINDOWEXPOSED: #The window lost its content, so the next update pushes the whole screen
+				windowExposed = True
 		
-		gameDisplay.fill(BLACK) #Whole screen is painted black in every iteration before any other drawings occur 
-			
 		mainBoard.gameAction() #Apply all the game actions here	
-		mainBoard.draw() #Draw the new board after game the new game actions
+		
+		if recordPath is not None:
+			if mainBoard.gameStatus == 'running' and mainBoard.recorder is None: #A new game started
+				gameCount = gameCount + 1
+				weights = tBot.weights if tBot.features == bot.DEFAULT_FEATURES else None # the header holds the four default weights
+				mainBoard.recorder = recording.GameRecorder(recordPath.format(game=gameCount), boardColNum, boardRowNum, weights=weights)
+			elif mainBoard.gameStatus == 'gameOver' and mainBoard.recorder is not None:
+				mainBoard.recorder.close()
+		rects = mainBoard.draw() #Draw what changed on the board after the new game actions
 		gameClock.update() #Increment the frame tick
 
-		tBot.update(copy.deepcopy(mainBoard.blockMat), mainBoard.piece, mainBoard.nextPieces, mainBoard.gameStatus, key)
+		tBot.update(mainBoard.occupancy, mainBoard.piece, mainBoard.nextPieces, mainBoard.gameStatus, key, mainBoard.occupancyVersion)
 		
 		if mainBoard.piece.status == "moving" and runCount == 0:
 			tBot.run()
@@ -74,12 +94,25 @@ def gameLoop():
 			tBot.movement(mainBoard.piece)
 
 		if mainBoard.score != 0:
-			tBot.drawBoard(gameDisplay) # draw mini board with bot analysis
+			rects += tBot.drawBoard(gameDisplay) # draw mini board with bot analysis
 
-		pygame.display.update() #Pygame display update
+		if windowExposed:
+			pygame.display.update()
+			windowExposed = False
+		else:
+			pygame.display.update(rects) #Pygame display update, only the changed areas
 		clock.tick(gameSpeed) #Pygame clock tick function (default is 60 fps)
 
+PROFILE_PATH = None #Set to a JSON file path to time the bot and the frame loop, the summary is written when the window closes. See profiling.py
+INSTANT_DROP = False #Set to True to let the bot hard drop each piece in a single frame instead of steering it down with the keys
+
+initDisplay()
 pygame.display.set_caption('Tetris')
+if PROFILE_PATH is not None:
+	profiler.enable()
 gameLoop()	
+if PROFILE_PATH is not None:
+	profiler.disable()
+	profiler.dump(PROFILE_PATH)
 pygame.quit()
 sys.exit()
\ No newline at end of file
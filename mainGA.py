@@ -1,8 +1,14 @@
 from tetris import *
 import sys
-import copy
+import os
+import math
+import random
 import bot
+import recording
+import batchsim
+from fitnessstore import FitnessStore
 import pygad
+import multiprocessing
 
 def gameLoop(solution):		
 	"""
@@ -18,14 +24,16 @@ def gameLoop(solution):
 	boardPosX = DISPLAY_WIDTH*0.3
 	boardPosY = DISPLAY_HEIGHT*0.15
 
+	gameDisplay, clock = initDisplay()
 	mainBoard = MainBoard(blockSize,boardPosX,boardPosY,boardColNum,boardRowNum,boardLineWidth,blockLineWidth,scoreBoardWidth)	
 	
-	tBot = bot.Bot()
+	tBot = bot.Bot(speculative=True, features=FEATURES) # searches the next piece while the current one falls
 	tBot.setWeights(solution)
 	
 	gameSpeed = 600
 	
 	gameExit = False
+	windowExposed = False
 
 	while not gameExit: #Stay in this loop unless the game is quit
 		
@@ -44,6 +52,10 @@ def gameLoop(solution):
 						key.restart.status = 'pressed'
 				if event.key == pygame.K_RETURN:
 					key.enter.status = 'pressed'
+				if event.key == pygame.K_SPACE: #Hard drops the falling piece
+					if key.hardDrop.status == 'idle':
+						key.hardDrop.trig = True
+						key.hardDrop.status = 'pressed'
 						
 			if event.type == pygame.KEYUP: #Keyboard keys release events
 				if event.key == pygame.K_p:
@@ -52,14 +64,17 @@ def gameLoop(solution):
 					key.restart.status = 'idle'
 				if event.key == pygame.K_RETURN:
 					key.enter.status = 'idle'
-		
-		gameDisplay.fill(BLACK) #Whole screen is painted black in every iteration before any other drawings occur 
+				if event.key == pygame.K_SPACE:
+					key.hardDrop.status = 'idle'
 			
+			if event.type == pygame.WINDOWEXPOSED: #The window lost its content, so the next update pushes the whole screen
+				windowExposed = True
+		
 		mainBoard.gameAction() #Apply all the game actions here	
-		mainBoard.draw() #Draw the new board after game the new game actions
+		rects = mainBoard.draw() #Draw what changed on the board after the new game actions
 		gameClock.update() #Increment the frame tick
 
-		tBot.update(copy.deepcopy(mainBoard.blockMat), mainBoard.piece, mainBoard.nextPieces, mainBoard.gameStatus, key)
+		tBot.update(mainBoard.occupancy, mainBoard.piece, mainBoard.nextPieces, mainBoard.gameStatus, key, mainBoard.occupancyVersion)
 		
 		if mainBoard.piece.status == "moving" and runCount == 0:
 			tBot.run()
@@ -70,33 +85,166 @@ def gameLoop(solution):
 			tBot.movement(mainBoard.piece)
 
 		if mainBoard.score != 0:
-			tBot.drawBoard(gameDisplay) # draw mini board with bot analysis
+			rects += tBot.drawBoard(gameDisplay) # draw mini board with bot analysis
 
 		if mainBoard.gameStatus == "gameOver":
 			key.enter.status = 'pressed'
 			return mainBoard.score
 
 
-		pygame.display.update() #Pygame display update
+		if windowExposed:
+			pygame.display.update()
+			windowExposed = False
+		else:
+			pygame.display.update(rects) #Pygame display update, only the changed areas
 		clock.tick(gameSpeed) #Pygame clock tick function(60 fps)
 		
 
-def fitness_func(ga_instance, solution, solution_idx):
-	score = gameLoop(solution)
+def engineGameLoop(solution, seed=None, maxPieces=None):
+	"""
+	Plays a game on the headless GameEngine, one piece placement per step.
+	seed draws the game's pieces, random ones when None. maxPieces ends the game early once that many pieces are placed.
+	Returns score as fitness to GA.
+	"""
+	if seed is None and RECORD_DIR is not None:
+		seed = random.getrandbits(32) # kept in the recording, so the game's pieces can be drawn again
+	engine = GameEngine(seed=seed)
+	if RECORD_DIR is not None:
+		recordCount[0] += 1 # the same seed is played by every solution
+		engine.recorder = recording.GameRecorder(os.path.join(RECORD_DIR, 'game-%d-%d-%d.ttr' % (os.getpid(), recordCount[0], seed)), engine.colNum, engine.rowNum, seed=seed,
+			weights=solution if FEATURES == bot.DEFAULT_FEATURES else None) # the header holds the four default weights
+
+	tBot = bot.Bot(cacheBytes=CACHE_BYTES, features=FEATURES)
+	tBot.setWeights(solution)
+
+	gameOver = False
+
+	while not gameOver and (maxPieces is None or engine.pieceCount < maxPieces):
+		tBot.update(engine.occupancy, engine.piece, engine.nextPieces, engine.gameStatus, key, engine.occupancyVersion)
+		tBot.run()
+		lines, score, gameOver = engine.step(tBot.getPlacement())
+
+	if engine.recorder is not None:
+		engine.recorder.close()
+
+	if tBot.transpositionTable is not None:
+		cacheStats['hits'] += tBot.transpositionTable.hits
+		cacheStats['misses'] += tBot.transpositionTable.misses
+
 	return score
 
+
+def evaluateGame(game):
+	"""
+	Plays one headless game, given as (solution, seed, maxPieces), in a worker process when the pool is used.
+	Returns the score with the transposition table hits and misses the game added.
+	"""
+	hits, misses = cacheStats['hits'], cacheStats['misses']
+	score = engineGameLoop(*game)
+	return score, cacheStats['hits'] - hits, cacheStats['misses'] - misses
+
+
+def playRound(solutions, seeds, maxPieces):
+	"""
+	Plays one game per seed for each solution, capped at maxPieces, in lockstep, across the worker pool or one by one.
+	Games already in the store are not played again. Returns each solution's total score over its games.
+	"""
+	games = [(solution, seed, maxPieces) for solution in solutions for seed in seeds]
+	scores = [None] * len(games)
+	if store is not None:
+		scores = [store.getScore(*game) for game in games]
+	missing = [i for i, score in enumerate(scores) if score is None]
+
+	if missing and LOCKSTEP:
+		engine = batchsim.BatchEngine(len(missing), seeds=[games[i][1] for i in missing], maxPieces=maxPieces)
+		played = [int(score) for score in batchsim.playGames(bot.Bot(features=FEATURES), engine, [games[i][0] for i in missing])]
+	elif missing:
+		if pool is not None:
+			results = pool.map(evaluateGame, [games[i] for i in missing])
+		else:
+			results = [evaluateGame(games[i]) for i in missing]
+		for score, hits, misses in results:
+			cacheStats['hits'] += hits
+			cacheStats['misses'] += misses
+		played = [score for score, hits, misses in results]
+	if missing:
+		for i, score in zip(missing, played):
+			scores[i] = score
+		if store is not None:
+			store.putScores([games[i] for i in missing], played)
+	return [int(sum(scores[i * len(seeds):(i + 1) * len(seeds)])) for i in range(len(solutions))]
+
+
+def raceSolutions(solutions):
+	"""
+	Successive halving over a batch of solutions: all of them play the games of the first round of RACE_ROUNDS,
+	then only the best RACE_KEEP fraction by total score so far plays the next, longer round, and so on.
+	Each round's seeds are shared by every solution, so they are compared on the same piece sequences.
+	Returns each solution's total score over the games it played. Solutions dropped in a round total less than the ones kept.
+	"""
+	totals = [0] * len(solutions)
+	racing = list(range(len(solutions)))
+	for roundIndex, (gameNum, maxPieces) in enumerate(RACE_ROUNDS):
+		if roundIndex > 0:
+			racing = sorted(racing, key=lambda i: totals[i], reverse=True)[:math.ceil(len(racing) * RACE_KEEP)]
+		scores = playRound([solutions[i] for i in racing], raceSeeds[roundIndex], maxPieces)
+		for i, score in zip(racing, scores):
+			totals[i] += score
+		raceStats['games'] += gameNum * len(racing)
+	return totals
+
+
+def warmWorker():
+	"""Pool initializer. Runs one bot decision so each worker pays its start-up cost once, before the first generation."""
+	engine = GameEngine()
+	tBot = bot.Bot()
+	tBot.update(engine.occupancy, engine.piece, engine.nextPieces, engine.gameStatus, key, engine.occupancyVersion)
+	tBot.run()
+
+
+def fitness_func(ga_instance, solution, solution_idx):
+	if not HEADLESS:
+		return gameLoop(solution)
+	
+	# pygad passes the whole batch of solutions, which race each other
+	return raceSolutions(solution)
+
 def on_gen(ga_instance):
 	print("Generation: ", ga_instance.generations_completed)
-	print("Fitness of best solution: ", ga_instance.best_solution())
+	print("Fitness of best solution: ", ga_instance.best_solution(pop_fitness=ga_instance.last_generation_fitness))
+	if CACHE_BYTES:
+		lookups = cacheStats['hits'] + cacheStats['misses']
+		print("Transposition table hits: ", cacheStats['hits'], "of", lookups, "lookups")
+	if HEADLESS:
+		print("Fitness games played: ", raceStats['games'])
+	if store is not None:
+		store.saveCheckpoint(ga_instance)
+		print("Fitness games found in the store: ", store.hits, "of", store.hits + store.misses)
 
 
-function_inputs = [1, 1, 1, -1]
+HEADLESS = True # play fitness games on the GameEngine instead of the frame loop
+FEATURES = bot.DEFAULT_FEATURES # names of the features the bot scores boards with, see features.py. The GA evolves one weight per feature
+CACHE_BYTES = 0 # memory cap of each bot's transposition table in headless games, 0 turns it off
+cacheStats = {'hits': 0, 'misses': 0}
+LOCKSTEP = False # play headless fitness games together as one batched simulation in this process, instead of one by one
+WORKERS = multiprocessing.cpu_count() # processes playing headless fitness games in parallel, 1 plays them in this process
+pool = None
+RECORD_DIR = None # directory to write every headless fitness game to as a binary recording, see recording.py. None records nothing
+recordCount = [0] # games recorded by this process, numbers their files
+RACE_ROUNDS = ((2, 50), (2, 200), (2, 1000)) # (games, piece cap) of each round of the headless fitness race, a cap of None plays to game over
+RACE_KEEP = 0.5 # fraction of the solutions of a round that go on to the next one
+RACE_SEED = 0 # draws the seeds of the race's games. They are the same for every solution and generation
+raceRandom = random.Random(RACE_SEED)
+raceSeeds = [[raceRandom.getrandbits(32) for i in range(gameNum)] for gameNum, maxPieces in RACE_ROUNDS]
+raceStats = {'games': 0}
+STORE_PATH = None # SQLite file keeping every headless fitness game's score and a checkpoint per generation, see fitnessstore.py. A run started on an existing file resumes from its last checkpoint. None keeps nothing
+store = None
 
 num_generations = 100
 num_parents_mating = 5
 
 sol_per_pop = 10
-num_genes = len(function_inputs)
+num_genes = len(FEATURES)
 
 init_range_low = 0
 init_range_high = 1
@@ -108,25 +256,40 @@ crossover_type = "single_point"
 mutation_type = "random"
 mutation_probability = 0.005
 
-ga_instance = pygad.GA(num_generations=num_generations,
-                       num_parents_mating=num_parents_mating,
-                       fitness_func=fitness_func,
-                       sol_per_pop=sol_per_pop,
-                       num_genes=num_genes,
-                       init_range_low=init_range_low,
-                       init_range_high=init_range_high,
-                       parent_selection_type=parent_selection_type,
-                       crossover_type=crossover_type,
-                       mutation_type=mutation_type,
-                       mutation_probability=mutation_probability,
-                       on_generation=on_gen)
-
-pygame.display.set_caption('Tetris GA')
-ga_instance.run()
-
-solution, solution_fitness, solution_idx = ga_instance.best_solution()
-print("Parameters of the best solution : {solution}".format(solution=solution))
-print("Fitness value of the best solution = {solution_fitness}".format(solution_fitness=solution_fitness))
-
-pygame.quit()
-sys.exit()
\ No newline at end of file
+if __name__ == '__main__': # worker processes import this module, so they must not start a run
+	ga_instance = pygad.GA(num_generations=num_generations,
+	                       num_parents_mating=num_parents_mating,
+	                       fitness_func=fitness_func,
+	                       sol_per_pop=sol_per_pop,
+	                       num_genes=num_genes,
+	                       init_range_low=init_range_low,
+	                       init_range_high=init_range_high,
+	                       parent_selection_type=parent_selection_type,
+	                       crossover_type=crossover_type,
+	                       mutation_type=mutation_type,
+	                       mutation_probability=mutation_probability,
+	                       fitness_batch_size=sol_per_pop if HEADLESS else None,
+	                       on_generation=on_gen)
+
+	if STORE_PATH is not None:
+		store = FitnessStore(STORE_PATH)
+		generation = store.resume(ga_instance)
+		if generation:
+			print("Resuming from generation", generation)
+	if not HEADLESS:
+		initDisplay()
+		pygame.display.set_caption('Tetris GA')
+	if HEADLESS and not LOCKSTEP and WORKERS > 1:
+		pool = multiprocessing.Pool(WORKERS, initializer=warmWorker) # kept for the whole run so workers are reused across generations
+	if ga_instance.num_generations > 0:
+		ga_instance.run()
+	if pool is not None:
+		pool.close()
+		pool.join()
+
+	solution, solution_fitness, solution_idx = ga_instance.best_solution(pop_fitness=ga_instance.last_generation_fitness)
+	print("Parameters of the best solution : {solution}".format(solution=solution))
+	print("Fitness value of the best solution = {solution_fitness}".format(solution_fitness=solution_fitness))
+
+	pygame.quit()
+	sys.exit()
\ No newline at end of file
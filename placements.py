@@ -0,0 +1,89 @@
+"""
+Placement tables built at import time for the bot's search.
+For each piece type, lists the distinct rotations with their size and per-column offsets,
+so a landing row can be computed from the column heights without moving a real piece.
+"""
+from tetris import pieceNames, getPlacementDef
+import numpy as np
+import bitboard
+import kernels
+
+class Rotation:
+	"""
+	A distinct rotation of a piece.
+	Its blocks are shifted to touch row 0 and column 0.
+	"""
+	def __init__(self, orientation, pieceDef):
+		self.orientation = orientation # number of clockwise rotations from spawn
+		self.pieceDef = pieceDef
+		self.width = max(pos[1] for pos in pieceDef) + 1
+		self.height = max(pos[0] for pos in pieceDef) + 1
+		self.bottoms = [max(pos[0] for pos in pieceDef if pos[1] == j) for j in range(self.width)] # lowest block row of each column
+		self.tops = [min(pos[0] for pos in pieceDef if pos[1] == j) for j in range(self.width)] # highest block row of each column
+		self.masks = bitboard.pieceMasks(pieceDef, 0)
+
+	def getMasks(self, col):
+		"""Returns the bitboard masks of the rotation with its leftmost column at col."""
+		return [(offset, mask << col) for offset, mask in self.masks]
+
+
+def buildPlacementTable():
+	"""Returns a dict of piece type to its list of distinct rotations."""
+	table = {}
+	for pieceType in pieceNames:
+		rotations = []
+		shapes = []
+		for orientation in range(4):
+			pieceDef = getPlacementDef(pieceType, orientation)
+			if sorted(pieceDef) not in shapes:
+				shapes.append(sorted(pieceDef))
+				rotations.append(Rotation(orientation, pieceDef))
+		table[pieceType] = rotations
+	return table
+
+PLACEMENT_TABLE = buildPlacementTable()
+
+
+class PlacementArrays:
+	"""
+	Every placement of a piece type on a board colNum wide, in the order the search adds them: by rotation, then column.
+	Kept as arrays so the landing rows and blocks of many nodes' children are found at once.
+	"""
+	def __init__(self, rotations, colNum):
+		self.rotations = [] # Rotation of each placement
+		cols = []
+		for rotation in rotations:
+			for col in range(colNum - rotation.width + 1):
+				self.rotations.append(rotation)
+				cols.append(col)
+		self.count = len(cols)
+		self.cols = np.array(cols)
+		self.orientations = np.array([rotation.orientation for rotation in self.rotations])
+		self.masks = [rotation.getMasks(col) for rotation, col in zip(self.rotations, cols)]
+		# the columns under each placement and the lowest block row in each, padded to 4 with the first column so their minimum is unchanged
+		self.columns = np.array([[col + j for j in range(rotation.width)] + [col] * (4 - rotation.width) for rotation, col in zip(self.rotations, cols)])
+		self.bottoms = np.array([rotation.bottoms + [rotation.bottoms[0]] * (4 - rotation.width) for rotation in self.rotations])
+		self.blockRows = np.array([[pos[0] for pos in rotation.pieceDef] for rotation in self.rotations])
+		self.blockCols = np.array([[col + pos[1] for pos in rotation.pieceDef] for rotation, col in zip(self.rotations, cols)])
+
+placementArrays = {} # PlacementArrays by (piece type, board width)
+
+def getPlacementArrays(pieceType, colNum):
+	"""Returns the PlacementArrays of a piece type on a board colNum wide, built on first use."""
+	key = (pieceType, colNum)
+	if key not in placementArrays:
+		placementArrays[key] = PlacementArrays(PLACEMENT_TABLE[pieceType], colNum)
+	return placementArrays[key]
+
+
+def landingRows(heights, parents, placements, rowNum):
+	"""
+	Returns the landing row of every placement of a PlacementArrays on each node of an array of parents: the row of the piece's top
+	when dropped, the highest row the lowest block of each of its columns fits above that column's height. -1 when it collides at row 0.
+	heights holds the column heights of the nodes parents index. Uses kernels.landingRows() when the kernels are on.
+	Returns a (parents, placements) array of rows.
+	"""
+	if kernels.jitEnabled:
+		return kernels.landingRows(heights, parents, placements.columns, placements.bottoms, rowNum)
+	parentHeights = heights[parents][:, placements.columns]
+	return np.maximum((rowNum - 1 - parentHeights - placements.bottoms).min(axis=2), -1)
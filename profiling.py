@@ -0,0 +1,280 @@
+"""
+Optional instrumentation of the bot's search and the game loop.
+While enabled, the hot methods of Bot and MainBoard are wrapped to time each call and count the nodes
+generated and evaluated per decision. Disabling restores the original methods, so there is no overhead when off.
+A cProfile and tracemalloc capture can also be taken over a range of decisions.
+
+Each thread keeps its own timers and counters, so a speculative bot's background searches neither mix into the
+per-decision numbers nor race on them. The summary reports the main thread's numbers under timers and counters,
+and those of the background threads, the speculation searches, under backgroundTimers and backgroundCounters.
+
+profiler.enable()
+... play ...
+profiler.disable()
+print(profiler.getSummary())
+profiler.dump('profile.json')
+"""
+import cProfile
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+import bot
+import tetris
+
+# (class, method name) pairs timed while the profiler is enabled
+TIMED_METHODS = (
+	(bot.Bot, 'run'),
+	(bot.Bot, 'createTree'),
+	(bot.Bot, 'createNodes'),
+	(bot.Bot, 'generatePosition'),
+	(bot.Bot, 'evaluateNodes'),
+	(bot.Bot, 'evaluateBatch'),
+	(bot.Bot, 'objFunc'),
+	(bot.Bot, 'objFuncIncremental'),
+	(tetris.MainBoard, 'gameAction'),
+	(tetris.MainBoard, 'draw'),
+)
+CAPTURE_TOP = 30 # functions and allocation sites kept in the summary of a capture
+
+class Timer:
+	"""Call count, total and longest time of one method."""
+	def __init__(self):
+		self.clear()
+
+	def clear(self):
+		self.calls = 0
+		self.total = 0.0
+		self.longest = 0.0
+
+	def add(self, elapsed):
+		self.calls += 1
+		self.total += elapsed
+		if elapsed > self.longest:
+			self.longest = elapsed
+
+	def getSummary(self):
+		return {
+			'calls': self.calls,
+			'totalMs': self.total * 1000,
+			'meanUs': self.total / self.calls * 1e6 if self.calls else 0.0,
+			'maxUs': self.longest * 1e6,
+		}
+
+
+class ThreadStats:
+	"""Timers and node counters of one thread."""
+	def __init__(self, background):
+		self.background = background # any thread but the main one, like a speculation search
+		self.timers = {} # Timer by method name
+		self.counters = {'nodesGenerated': 0, 'nodesEvaluated': 0}
+
+	def getTimer(self, name):
+		timer = self.timers.get(name)
+		if timer is None:
+			timer = self.timers[name] = Timer()
+		return timer
+
+
+class Profiler:
+	"""Collects timings, node counters and per-decision statistics while enabled."""
+	def __init__(self):
+		self.enabled = False
+		self.originals = {}
+		self.lock = threading.Lock() # guards threadStats, each thread only writes to its own ThreadStats
+		self.reset()
+
+	def reset(self):
+		"""Clears everything collected so far."""
+		with self.lock:
+			self.threadStats = {} # ThreadStats by threading.get_ident()
+		self.decisions = [] # one dict per Bot.run call
+		self.captureRange = None
+		self.captureProfile = None
+		self.captureMemory = False
+		self.capture = None # summary of the last finished capture
+
+	def enable(self):
+		"""Wraps the methods of TIMED_METHODS with timed versions."""
+		if self.enabled:
+			return
+		for cls, name in TIMED_METHODS:
+			original = cls.__dict__[name]
+			self.originals[cls, name] = original
+			setattr(cls, name, self.wrap(cls.__name__ + '.' + name, original))
+		self.enabled = True
+
+	def disable(self):
+		"""Puts the original methods back. Collected data is kept."""
+		if not self.enabled:
+			return
+		for (cls, name), original in self.originals.items():
+			setattr(cls, name, original)
+		self.originals = {}
+		self.enabled = False
+		self.stopCapture()
+
+	def getThreadStats(self):
+		"""Returns the ThreadStats of the calling thread."""
+		ident = threading.get_ident()
+		stats = self.threadStats.get(ident)
+		if stats is None:
+			with self.lock:
+				stats = self.threadStats[ident] = ThreadStats(threading.current_thread() is not threading.main_thread())
+		return stats
+
+	def wrap(self, name, func):
+		"""
+		Returns func timed under name in the calling thread's ThreadStats.
+		Bot.run also records a decision, with the nodes its own thread generated and evaluated. createNodes and evaluateNodes count nodes.
+		"""
+		perfCounter = time.perf_counter
+		if name == 'Bot.run':
+			def wrapper(tBot, *args, **kwargs):
+				stats = self.getThreadStats()
+				self.startDecision()
+				generated = stats.counters['nodesGenerated']
+				evaluated = stats.counters['nodesEvaluated']
+				start = perfCounter()
+				try:
+					return func(tBot, *args, **kwargs)
+				finally:
+					elapsed = perfCounter() - start
+					stats.getTimer(name).add(elapsed)
+					self.decisions.append({
+						'ms': elapsed * 1000,
+						'nodesGenerated': stats.counters['nodesGenerated'] - generated,
+						'nodesEvaluated': stats.counters['nodesEvaluated'] - evaluated,
+						'completedDepth': tBot.completedDepth,
+					})
+					self.endDecision()
+		elif name == 'Bot.createNodes':
+			def wrapper(tBot, *args, **kwargs):
+				stats = self.getThreadStats()
+				count = tBot.tree.count
+				start = perfCounter()
+				try:
+					return func(tBot, *args, **kwargs)
+				finally:
+					stats.getTimer(name).add(perfCounter() - start)
+					stats.counters['nodesGenerated'] += tBot.tree.count - count
+		elif name == 'Bot.evaluateNodes':
+			def wrapper(tBot, nodes, *args, **kwargs):
+				stats = self.getThreadStats()
+				start = perfCounter()
+				try:
+					return func(tBot, nodes, *args, **kwargs)
+				finally:
+					stats.getTimer(name).add(perfCounter() - start)
+					stats.counters['nodesEvaluated'] += len(nodes)
+		else:
+			def wrapper(*args, **kwargs):
+				stats = self.getThreadStats()
+				start = perfCounter()
+				try:
+					return func(*args, **kwargs)
+				finally:
+					stats.getTimer(name).add(perfCounter() - start)
+		wrapper.__name__ = func.__name__
+		wrapper.__doc__ = func.__doc__
+		return wrapper
+
+	def captureDecisions(self, first, last, profile=True, memory=False):
+		"""
+		Takes a cProfile and/or tracemalloc capture from decision first up to, not including, decision last.
+		Decisions are counted from 0 since the last reset(). The profiler must be enabled.
+		cProfile only sees the thread making the decisions, while tracemalloc counts the allocations of every thread, speculation included.
+		"""
+		self.captureRange = (first, last)
+		self.captureProfile = cProfile.Profile() if profile else None
+		self.captureMemory = memory
+
+	def startDecision(self):
+		if self.captureRange is not None and len(self.decisions) == self.captureRange[0]:
+			if self.captureMemory:
+				tracemalloc.start()
+			if self.captureProfile is not None:
+				self.captureProfile.enable()
+
+	def endDecision(self):
+		if self.captureRange is not None and len(self.decisions) >= self.captureRange[1]:
+			self.stopCapture()
+
+	def stopCapture(self):
+		"""Ends a running capture and keeps its summary in self.capture."""
+		if self.captureRange is None or len(self.decisions) <= self.captureRange[0]:
+			return
+		self.capture = {'decisions': [self.captureRange[0], len(self.decisions)]}
+		if self.captureProfile is not None:
+			self.captureProfile.disable()
+			stats = pstats.Stats(self.captureProfile)
+			self.capture['stats'] = stats
+			functions = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:CAPTURE_TOP]
+			self.capture['functions'] = [{
+				'function': '%s:%d(%s)' % func,
+				'calls': calls,
+				'tottimeMs': tottime * 1000,
+				'cumtimeMs': cumtime * 1000,
+			} for func, (primitiveCalls, calls, tottime, cumtime, callers) in functions]
+		if self.captureMemory:
+			snapshot = tracemalloc.take_snapshot()
+			current, peak = tracemalloc.get_traced_memory()
+			tracemalloc.stop()
+			self.capture['memory'] = {
+				'currentBytes': current,
+				'peakBytes': peak,
+				'top': [{'site': str(stat.traceback), 'bytes': stat.size, 'blocks': stat.count} for stat in snapshot.statistics('lineno')[:CAPTURE_TOP]],
+			}
+		self.captureRange = None
+		self.captureProfile = None
+		self.captureMemory = False
+
+	def mergeStats(self, background):
+		"""Returns the timers and counters of the main thread, or of all the background threads added together."""
+		timers = {}
+		counters = {'nodesGenerated': 0, 'nodesEvaluated': 0}
+		with self.lock:
+			threadStats = [stats for stats in self.threadStats.values() if stats.background == background]
+		for stats in threadStats:
+			for name, timer in list(stats.timers.items()):
+				merged = timers.setdefault(name, Timer())
+				merged.calls += timer.calls
+				merged.total += timer.total
+				merged.longest = max(merged.longest, timer.longest)
+			for name, value in stats.counters.items():
+				counters[name] += value
+		return timers, counters
+
+	def getSummary(self, includeDecisions=False):
+		"""
+		Returns the collected data as a dict of plain values, ready for JSON.
+		timers, counters and the per-decision numbers are the main thread's, without speculation.
+		backgroundTimers and backgroundCounters hold the work of the speculation threads, which no decision includes.
+		"""
+		timers, counters = self.mergeStats(False)
+		backgroundTimers, backgroundCounters = self.mergeStats(True)
+		summary = {
+			'timers': {name: timer.getSummary() for name, timer in timers.items() if timer.calls},
+			'counters': counters,
+			'backgroundTimers': {name: timer.getSummary() for name, timer in backgroundTimers.items() if timer.calls},
+			'backgroundCounters': backgroundCounters,
+			'decisions': len(self.decisions),
+		}
+		if self.decisions:
+			for key in ('ms', 'nodesGenerated', 'nodesEvaluated'):
+				values = [decision[key] for decision in self.decisions]
+				summary['perDecision.' + key] = {'mean': sum(values) / len(values), 'max': max(values)}
+		if includeDecisions:
+			summary['decisionLog'] = self.decisions
+		if self.capture is not None:
+			summary['capture'] = {key: value for key, value in self.capture.items() if key != 'stats'}
+		return summary
+
+	def dump(self, path, includeDecisions=False):
+		"""Writes getSummary() to a JSON file."""
+		with open(path, 'w') as f:
+			json.dump(self.getSummary(includeDecisions), f, indent=2)
+
+
+profiler = Profiler()
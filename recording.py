@@ -0,0 +1,183 @@
+"""
+Compact binary recordings of games, one file per game.
+A file starts with a fixed-size header holding the board size, seed and bot weights, followed by one
+fixed-width record per placed piece: piece type, orientation, column, lines cleared and score gained.
+Recordings are read through a memory map and can be re-simulated on a GameEngine without a display.
+python recording.py checks that a MainBoard game and its replay on a GameEngine score the same.
+"""
+import struct
+import os
+import sys
+import numpy as np
+from tetris import GameEngine, pieceNames
+
+MAGIC = b'TTRC'
+VERSION = 1
+HEADER = struct.Struct('<4sHBBBBq4d14x') # magic, version, colNum, rowNum, previewNum, flags, seed, weights, padding to 64 bytes
+HAS_SEED = 1
+HAS_WEIGHTS = 2
+RECORD_DTYPE = np.dtype([('piece', 'u1'), ('orientation', 'u1'), ('col', 'u1'), ('lines', 'u1'), ('scoreDelta', '<u4')])
+RECORD = struct.Struct('<BBBBI') # same layout as RECORD_DTYPE
+
+class GameRecorder:
+	"""
+	Writes one game to a recording file.
+	Set it as the recorder of a MainBoard or GameEngine, which then calls record() for every piece they place.
+	"""
+	def __init__(self, path, colNum=10, rowNum=20, seed=None, weights=None, previewNum=1):
+		self.path = path
+		self.file = open(path, 'wb')
+		flags = 0
+		if seed is not None:
+			flags |= HAS_SEED
+		if weights is not None:
+			flags |= HAS_WEIGHTS
+		self.file.write(HEADER.pack(MAGIC, VERSION, colNum, rowNum, previewNum, flags, 0 if seed is None else seed, *(weights if weights is not None else (0, 0, 0, 0))))
+		self.count = 0
+
+	def record(self, pieceType, orientation, col, lines, scoreDelta):
+		"""Appends the placement of one piece."""
+		self.file.write(RECORD.pack(pieceNames.index(pieceType), orientation, col, lines, scoreDelta))
+		self.count += 1
+
+	def close(self):
+		if not self.file.closed:
+			self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self.close()
+
+
+class GameRecording:
+	"""
+	A recording file opened for reading. Its records are a memory-mapped NumPy structured array of RECORD_DTYPE,
+	so columns like records['lines'] can be read across millions of placements without loading the file.
+	A record cut short, by a game that was still being written, is left out.
+	"""
+	def __init__(self, path):
+		self.path = path
+		with open(path, 'rb') as f:
+			header = f.read(HEADER.size)
+		if len(header) < HEADER.size or header[:4] != MAGIC:
+			raise ValueError("%s is not a game recording" % path)
+		magic, version, self.colNum, self.rowNum, self.previewNum, flags, seed, *weights = HEADER.unpack(header)
+		if version != VERSION:
+			raise ValueError("%s has recording version %d, expected %d" % (path, version, VERSION))
+		self.seed = seed if flags & HAS_SEED else None
+		self.weights = weights if flags & HAS_WEIGHTS else None
+
+		count = (os.path.getsize(path) - HEADER.size) // RECORD_DTYPE.itemsize
+		if count:
+			self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER.size, shape=(count,))
+		else:
+			self.records = np.zeros(0, dtype=RECORD_DTYPE)
+
+	def __len__(self):
+		return len(self.records)
+
+	def getScore(self):
+		"""Returns the score at the end of the recording."""
+		return int(self.records['scoreDelta'].sum(dtype=np.int64))
+
+	def getPlacements(self):
+		"""Returns the recorded (orientation, col) placements, as GameEngine.step() takes them."""
+		return list(zip(self.records['orientation'].tolist(), self.records['col'].tolist()))
+
+
+class ReplayEngine(GameEngine):
+	"""GameEngine that draws its pieces from a recording instead of its random generator, so games without a seed can be replayed."""
+	def __init__(self, recording):
+		self.recordedPieces = recording.records['piece'].tolist()
+		self.drawnPieces = 0
+		GameEngine.__init__(self, recording.colNum, recording.rowNum, recording.seed, recording.previewNum)
+
+	def drawPiece(self):
+		if self.drawnPieces < len(self.recordedPieces):
+			pieceType = pieceNames[self.recordedPieces[self.drawnPieces]]
+		else: #The preview queue looks past the end of the recording
+			pieceType = pieceNames[self.random.randint(0,6)]
+		self.drawnPieces += 1
+		return pieceType
+
+	def generateNextPieces(self):
+		for i in range(len(self.nextPieces)):
+			self.nextPieces[i] = self.drawPiece()
+
+	def generateNextPiece(self):
+		self.nextPieces.pop(0)
+		self.nextPieces.append(self.drawPiece())
+
+
+def replay(recording):
+	"""
+	Re-simulates a recording on a ReplayEngine, placing each recorded piece in turn.
+	Yields the engine, the record and the number of lines the placement cleared, after each placement.
+	"""
+	engine = ReplayEngine(recording)
+	for record in recording.records:
+		lines, score, gameOver = engine.step((int(record['orientation']), int(record['col'])))
+		yield engine, record, lines
+
+
+def verify(recording):
+	"""
+	Returns the index of the first record whose cleared lines differ from the re-simulation, or None if they all match.
+	Scores are not compared, as MainBoard games also score the points of soft drops, where GameEngine hard drops every piece.
+	"""
+	for i, (engine, record, lines) in enumerate(replay(recording)):
+		if lines != record['lines']:
+			return i
+	return None
+
+
+def checkScoring(seed=0, maxPieces=100):
+	"""
+	Plays a MainBoard game frame by frame with a bot that hard drops every piece, recording it, and replays the recording on a GameEngine.
+	Both must score each placement the same, drop points included. Returns the indices of the records that score differently.
+	"""
+	import random
+	import tempfile
+	import bot
+	from tetris import MainBoard, gameClock, key
+
+	random.seed(seed) # MainBoard draws its pieces from the random module
+	board = MainBoard(20, 0, 0, 10, 20, 10, 1, 100)
+	board.restart()
+	tBot = bot.Bot(instantDrop=True)
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, 'game.ttr')
+		board.recorder = GameRecorder(path, board.colNum, board.rowNum)
+		runCount = 0
+		while board.gameStatus == 'running' and board.recorder.count < maxPieces:
+			board.gameAction()
+			gameClock.update()
+			tBot.update(board.occupancy, board.piece, board.nextPieces, board.gameStatus, key, board.occupancyVersion)
+			if board.piece.status == 'moving' and runCount == 0:
+				tBot.run()
+				runCount = 1
+			if board.piece.status == 'uncreated':
+				runCount = 0
+			else:
+				tBot.movement(board.piece)
+		board.recorder.close()
+
+		recording = GameRecording(path)
+		differences = []
+		score = 0
+		for i, (engine, record, lines) in enumerate(replay(recording)):
+			if engine.score - score != record['scoreDelta']:
+				differences.append(i)
+			score = engine.score
+		del recording # releases the memory map before the file is removed
+	return differences
+
+
+if __name__ == '__main__':
+	differences = checkScoring()
+	if differences:
+		print("MISMATCH at records", differences)
+		sys.exit(1)
+	print("MainBoard and GameEngine scores match")
@@ -0,0 +1,196 @@
+"""
+The bot's search tree, stored as parallel arrays with one entry per node instead of one object per node.
+The arrays are allocated once and grow by doubling. clear() keeps them, so a search allocates nothing per node
+once they are large enough. Nodes are added level by level, so a level's children all come after it
+and an unfinished level is dropped by truncating the tree.
+
+Boards take rows x cols cells each, so they are not kept for every node. A node's board is in one of the board slots:
+kept slots hold the boards of the nodes that can be expanded, and the slots after them are scratch space
+reused by each batch of children while it is evaluated. Nodes whose scratch board was released have slot -1.
+"""
+import numpy as np
+
+INITIAL_CAPACITY = 1024 # nodes the arrays hold before they first grow
+INITIAL_BOARD_CAPACITY = 256 # board slots before they first grow
+
+class TreeNode:
+	"""
+	A copy of one node's fields, for debugging and to keep the chosen placement once the tree is reused.
+	TreeNode() stands for no placement.
+	"""
+	__slots__ = ('index', 'parent', 'data', 'coords', 'orientation', 'rotation', 'evaluation', 'avgColumnHeight', 'bumpiness', 'holes', 'lines', 'columnHeights', 'columnHoles', 'zobrist')
+
+	def __init__(self, tree=None, index=-1):
+		self.index = index
+		if tree is None:
+			self.parent = -1
+			self.data = None
+			self.coords = [0,0]
+			self.orientation = 0
+			self.rotation = None
+			self.evaluation = 0
+			self.avgColumnHeight = 0
+			self.bumpiness = 0
+			self.holes = 0
+			self.lines = 0
+			self.columnHeights = None
+			self.columnHoles = None
+			self.zobrist = None
+			return
+		self.parent = int(tree.parent[index])
+		self.data, self.lines, self.columnHeights, self.columnHoles, self.avgColumnHeight, self.bumpiness, self.holes, self.evaluation, self.zobrist = tree.getValues(index)
+		self.coords = [int(tree.row[index]), int(tree.col[index])]
+		self.orientation = int(tree.orientation[index])
+		self.rotation = tree.rotation[index]
+
+	def __repr__(self):
+		return 'TreeNode(%d, parent=%d, coords=%s, orientation=%d, evaluation=%s)' % (self.index, self.parent, self.coords, self.orientation, self.evaluation)
+
+
+class SearchTree:
+	"""
+	Nodes of the search tree, node i being entry i of each array. The root is node 0 and has parent -1.
+	Board slots are a (boardCapacity, rows, cols) array, or a list of bitboard rows with the bitboard backend.
+	Fields holding Python objects (bitboard rows, rotations, 64 bit hashes) are lists.
+	"""
+	def __init__(self, rowNum, colNum, bitboards, capacity=INITIAL_CAPACITY, boardCapacity=INITIAL_BOARD_CAPACITY):
+		self.rowNum = rowNum
+		self.colNum = colNum
+		self.bitboards = bitboards # boards are bitboard rows, and column holes are kept for incremental evaluation
+		self.count = 0
+		self.capacity = capacity
+		self.parent = np.empty(capacity, dtype=np.int32)
+		self.row = np.empty(capacity, dtype=np.int16) # top row of the placed piece, -1 when it sticks out of the top
+		self.col = np.empty(capacity, dtype=np.int16) # leftmost column of the placed piece
+		self.orientation = np.empty(capacity, dtype=np.int8)
+		self.blockRows = np.empty((capacity, 4), dtype=np.int8) # rows of the placed piece's blocks below its top row
+		self.blockCols = np.empty((capacity, 4), dtype=np.int16) # columns of the placed piece's blocks
+		self.evaluation = np.empty(capacity)
+		self.avgColumnHeight = np.empty(capacity)
+		self.bumpiness = np.empty(capacity, dtype=np.int32)
+		self.holes = np.empty(capacity, dtype=np.int32)
+		self.lines = np.empty(capacity) # line bonus of the lines the placement cleared
+		self.columnHeights = np.empty((capacity, colNum), dtype=np.int16)
+		self.columnHoles = np.empty((capacity, colNum), dtype=np.int16) if bitboards else None
+		self.boardSlot = np.empty(capacity, dtype=np.int32) # slot of the node's board, -1 when it has none
+		self.boardCount = 0 # kept slots, scratch slots come after them
+		self.boardCapacity = boardCapacity
+		self.boards = [None] * boardCapacity if bitboards else np.empty((boardCapacity, rowNum, colNum), dtype=np.int8)
+		self.rotation = [None] * capacity # placements.Rotation of the piece placed to reach the node
+		self.zobrist = [None] * capacity
+
+	def clear(self):
+		"""Removes every node, keeping the arrays."""
+		self.count = 0
+		self.boardCount = 0
+
+	def truncate(self, count):
+		"""Removes the nodes from index count on, and the boards kept for them."""
+		self.count = count
+		self.boardCount = int(self.boardSlot[:count].max()) + 1 # slots after the last one the remaining nodes use are free
+
+	def add(self, count):
+		"""Adds count nodes with unset fields, growing the arrays if needed. Returns the index of the first."""
+		start = self.count
+		if start + count > self.capacity:
+			self.grow(start + count)
+		self.count += count
+		return start
+
+	def grow(self, minCapacity):
+		"""Reallocates every array with at least minCapacity entries, keeping the nodes."""
+		capacity = self.capacity
+		while capacity < minCapacity:
+			capacity *= 2
+		for name in ('parent', 'row', 'col', 'orientation', 'blockRows', 'blockCols', 'evaluation', 'avgColumnHeight', 'bumpiness', 'holes', 'lines', 'columnHeights', 'columnHoles', 'boardSlot'):
+			old = getattr(self, name)
+			if old is None:
+				continue
+			new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+			new[:self.count] = old[:self.count]
+			setattr(self, name, new)
+		self.rotation += [None] * (capacity - self.capacity)
+		self.zobrist += [None] * (capacity - self.capacity)
+		self.capacity = capacity
+
+	def addBoards(self, count, keep):
+		"""
+		Takes count board slots after the kept ones, growing the slots if needed. Returns the first.
+		Kept slots stay until the tree is cleared or truncated, scratch slots are taken again by the next call.
+		"""
+		start = self.boardCount
+		if start + count > self.boardCapacity:
+			capacity = self.boardCapacity
+			while capacity < start + count:
+				capacity *= 2
+			if self.bitboards:
+				self.boards += [None] * (capacity - self.boardCapacity)
+			else:
+				boards = np.empty((capacity, self.rowNum, self.colNum), dtype=np.int8)
+				boards[:start] = self.boards[:start]
+				self.boards = boards
+			self.boardCapacity = capacity
+		if keep:
+			self.boardCount += count
+		return start
+
+	def releaseBoards(self, start, end):
+		"""Drops the scratch boards of the nodes from start to end, once they are evaluated."""
+		self.boardSlot[start:end] = -1
+
+	def getBoard(self, index):
+		"""Returns the node's board, kept or in scratch space, or None if it has none."""
+		slot = self.boardSlot[index]
+		return None if slot < 0 else self.boards[slot]
+
+	def addRoot(self, data, columnHeights):
+		"""Clears the tree and adds the board as its root, node 0."""
+		self.clear()
+		root = self.add(1)
+		self.parent[root] = -1
+		self.row[root] = 0
+		self.col[root] = 0
+		self.orientation[root] = 0
+		self.blockRows[root] = 0
+		self.blockCols[root] = 0
+		self.evaluation[root] = 0
+		self.avgColumnHeight[root] = 0
+		self.bumpiness[root] = 0
+		self.holes[root] = 0
+		self.lines[root] = 0
+		self.columnHeights[root] = columnHeights
+		self.boardSlot[root] = self.addBoards(1, True)
+		self.boards[self.boardSlot[root]] = data
+		self.rotation[root] = None
+		self.zobrist[root] = None
+		return root
+
+	def getValues(self, index):
+		"""
+		Returns a copy of the node's evaluated fields as (board, lines, column heights, column holes,
+		average height, bumpiness, holes, evaluation, zobrist). Column holes are None without bitboards, the board None if the node has none.
+		"""
+		data = self.getBoard(index) # bitboard rows are never changed once built, arrays are copied
+		if self.bitboards:
+			columnHoles = self.columnHoles[index].tolist()
+		else:
+			if data is not None:
+				data = data.copy()
+			columnHoles = None
+		return (data, float(self.lines[index]), self.columnHeights[index].tolist(), columnHoles, float(self.avgColumnHeight[index]),
+			int(self.bumpiness[index]), int(self.holes[index]), float(self.evaluation[index]), self.zobrist[index])
+
+	def setValues(self, index, values):
+		"""Sets the node's evaluated fields from a tuple returned by getValues()."""
+		data, self.lines[index], self.columnHeights[index], columnHoles, self.avgColumnHeight[index], self.bumpiness[index], self.holes[index], self.evaluation[index], self.zobrist[index] = values
+		self.boards[self.boardSlot[index]] = data
+		if self.bitboards:
+			self.columnHoles[index] = columnHoles
+
+	def getNode(self, index):
+		"""Returns a TreeNode copy of the node."""
+		return TreeNode(self, index)
+
+	def getChildren(self, index):
+		"""Returns the indices of the node's children."""
+		return np.flatnonzero(self.parent[:self.count] == index)
@@ -0,0 +1,7 @@
+"""Checks that the compiled kernels match the NumPy code, see kernels.checkParity()."""
+import pytest
+import kernels
+
+@pytest.mark.skipif(not kernels.JIT_AVAILABLE, reason="needs Numba")
+def test_parity():
+	assert kernels.checkParity(seeds=(0,), maxPieces=30, wideSize=None) == []
@@ -1,15 +1,16 @@
 import pygame #version 2.5.2
 import random
 import math
+import os
 
-pygame.init()
-pygame.font.init()
+#The display, clock and fonts are created by initDisplay() on the first render, so the game logic can be imported without a window
+DISPLAY_DISABLED = os.environ.get('TETRIS_HEADLESS', '0') == '1' #Set TETRIS_HEADLESS=1 to never touch the video subsystem, initDisplay() then raises
 
 DISPLAY_WIDTH = 800
 DISPLAY_HEIGHT = 600
 
-gameDisplay = pygame.display.set_mode((DISPLAY_WIDTH,DISPLAY_HEIGHT))
-clock = pygame.time.Clock()
+gameDisplay = None
+clock = None
 
 pieceNames = ('I', 'O', 'T', 'S', 'Z', 'J', 'L')
 
@@ -28,12 +29,29 @@ GAMEOVER_FONT_SIZE = 66
 TITLE_FONT_SIZE = 70
 VERSION_FONT_SIZE = 20
 
-fontSB = pygame.font.SysFont('agencyfb', SB_FONT_SIZE)
-fontSmall = pygame.font.SysFont('agencyfb', FONT_SIZE_SMALL)
-fontPAUSE = pygame.font.SysFont('agencyfb', PAUSE_FONT_SIZE)
-fontGAMEOVER = pygame.font.SysFont('agencyfb', GAMEOVER_FONT_SIZE)
-fontTitle = pygame.font.SysFont('agencyfb', TITLE_FONT_SIZE)
-fontVersion = pygame.font.SysFont('agencyfb', VERSION_FONT_SIZE)
+fontSB = None
+fontSmall = None
+fontPAUSE = None
+fontGAMEOVER = None
+fontTitle = None
+fontVersion = None
+
+def initDisplay(): #Opens the window and loads the clock and fonts the first time it is called. Returns the display surface and the clock
+	global gameDisplay, clock, fontSB, fontSmall, fontPAUSE, fontGAMEOVER, fontTitle, fontVersion
+	if gameDisplay is None:
+		if DISPLAY_DISABLED:
+			raise RuntimeError("tetris is in headless mode (TETRIS_HEADLESS=1), it cannot open a display")
+		pygame.init()
+		pygame.font.init()
+		gameDisplay = pygame.display.set_mode((DISPLAY_WIDTH,DISPLAY_HEIGHT))
+		clock = pygame.time.Clock()
+		fontSB = pygame.font.SysFont('agencyfb', SB_FONT_SIZE)
+		fontSmall = pygame.font.SysFont('agencyfb', FONT_SIZE_SMALL)
+		fontPAUSE = pygame.font.SysFont('agencyfb', PAUSE_FONT_SIZE)
+		fontGAMEOVER = pygame.font.SysFont('agencyfb', GAMEOVER_FONT_SIZE)
+		fontTitle = pygame.font.SysFont('agencyfb', TITLE_FONT_SIZE)
+		fontVersion = pygame.font.SysFont('agencyfb', VERSION_FONT_SIZE)
+	return gameDisplay, clock
 
 ROW = (0)
 COL = (1)
@@ -85,6 +103,73 @@ baseLinePoints = (0,40,100,300,1200)
 #Drop means the action the player forces the piece down instead of free fall(By key combinations: down, down-left, down-rigth arrows)
 
 
+def getLevel(lines):
+	"""Returns the level reached after clearing the given number of lines. Each 10 cleared lines means a level up."""
+	level = STARTING_LEVEL + math.floor(lines/10)
+	if level > 99:
+		level = 99
+	return level
+
+def fillOccupancy(blockMat,occupancy): #Writes blockMat into the numeric occupancy mirror, one integer per row with bit col set for each filled cell
+	for row in range(0,len(blockMat)):
+		bits = 0
+		for col in range(0,len(blockMat[row])):
+			if blockMat[row][col] != 'empty':
+				bits = bits | (1 << col)
+		occupancy[row] = bits
+
+textSurfaces = {} #Rendered text by font, string and color. Labels repeat every frame, so each is only rendered once
+TEXT_CACHE_SIZE = 1024
+
+def renderText(font,text,color): #Returns the rendered text surface, from textSurfaces when it was rendered before
+	textKey = (font,text,tuple(color))
+	surface = textSurfaces.get(textKey)
+	if surface is None:
+		if len(textSurfaces) >= TEXT_CACHE_SIZE: #Scores and sine colors keep adding new strings
+			textSurfaces.clear()
+		surface = font.render(text, False, color)
+		textSurfaces[textKey] = surface
+	return surface
+
+def rotateDef(pieceType,pieceDef): #Returns the clockwise rotation of a piece definition, same as MovingPiece.rotate without collision checks
+	if pieceType == 'O':
+		return [list(pos) for pos in pieceDef]
+	if pieceType == 'I':
+		pieceMatSize = 4
+	else:
+		pieceMatSize = 3
+	return [[pos[COL], (pieceMatSize - 1) - pos[ROW]] for pos in pieceDef]
+
+def getSpawnCol(colNum): #Returns the column of the spawn origin, which centres the 4 wide piece matrix on the board (column 3 of 10)
+	return colNum // 2 - 2
+
+def getPlacementDef(pieceType,orientation): #Returns the block definition of a piece after the given number of clockwise rotations, shifted to touch row 0 and column 0
+	pieceDef = [list(pos) for pos in pieceDefs[pieceType]]
+	for i in range(orientation):
+		pieceDef = rotateDef(pieceType,pieceDef)
+	minRow = min(pos[ROW] for pos in pieceDef)
+	minCol = min(pos[COL] for pos in pieceDef)
+	return [[pos[ROW] - minRow, pos[COL] - minCol] for pos in pieceDef]
+
+def getSpawnRow(pieceType,orientation): #Returns the top row of a piece rotated the given number of times where it spawns. Rotations keep the spawn origin
+	pieceDef = [list(pos) for pos in pieceDefs[pieceType]]
+	for i in range(orientation):
+		pieceDef = rotateDef(pieceType,pieceDef)
+	return min(pos[ROW] for pos in pieceDef)
+
+def getDropScore(pieceType,orientation,row): #Returns the points of hard dropping a placement from where it spawns to the given top row, one per row like MovingPiece.hardDrop
+	return max(row - getSpawnRow(pieceType,orientation), 0)
+
+def findPlacement(pieceType,positions): #Returns the (orientation, col) placement of a piece with blocks at the given board positions, the inverse of getPlacementDef
+	minRow = min(pos[ROW] for pos in positions)
+	minCol = min(pos[COL] for pos in positions)
+	shape = sorted([pos[ROW] - minRow, pos[COL] - minCol] for pos in positions)
+	for orientation in range(4):
+		if sorted(getPlacementDef(pieceType,orientation)) == shape:
+			return orientation, minCol
+	raise ValueError("Blocks %s are not a rotation of piece %s" % (positions, pieceType))
+
+
 class GameKeyInput:
 	"""Class for the game input keys and their status"""
 
@@ -96,6 +181,7 @@ class GameKeyInput:
 		self.enter = self.KeyName('idle',False) # 'pressed' //KEY Enter
 		self.pause = self.KeyName('idle',False) # 'pressed' //KEY P
 		self.restart = self.KeyName('idle',False) # 'pressed' //KEY R
+		self.hardDrop = self.KeyName('idle',False) # 'pressed' //KEY SPACE
 	
 	class KeyName:
 	
@@ -149,7 +235,7 @@ gameClock = GameClock()
 
 class MainBoard:
 	"""Class for all the game mechanics, visuals and events"""
-	def __init__(self,blockSize,xPos,yPos,colNum,rowNum,boardLineWidth,blockLineWidth,scoreBoardWidth):
+	def __init__(self,blockSize,xPos,yPos,colNum,rowNum,boardLineWidth,blockLineWidth,scoreBoardWidth,previewNum=1):
 		
 		#Size and position initiations
 		self.blockSize = blockSize
@@ -164,6 +250,10 @@ class MainBoard:
 		#Matrix that contains all the existing blocks in the game board, except the moving piece
 		self.blockMat = [['empty'] * colNum for i in range(rowNum)]
 		
+		#Numeric mirror of blockMat for the bot. Only updated when blocks lock, lines clear or the game restarts, each time with a new version
+		self.occupancy = [0] * rowNum
+		self.occupancyVersion = 0
+		
 		self.piece = MovingPiece(colNum,rowNum,'uncreated')
 		
 		self.lineClearStatus = 'idle' # 'clearRunning' 'clearFin'
@@ -171,21 +261,33 @@ class MainBoard:
 		
 		self.gameStatus = 'firstStart' # 'running' 'gameOver'
 		self.gamePause = False
-		self.nextPieces = ['I','I']
+		self.nextPieces = ['I'] * (previewNum + 1) #Current piece followed by previewNum upcoming pieces
 		
 		self.score = 0
 		self.level = STARTING_LEVEL
 		self.lines = 0
+		
+		#Dirty-region rendering. What each board cell and the scoreboard showed on the last draw, so only changes are redrawn
+		self.drawnCells = None #None redraws the whole screen on the next draw
+		self.drawnBoardState = None
+		self.drawnScoreState = None
+		self.blockSprites = {} #Pre-rendered block surface of each color
+		
+		self.recorder = None #Optional recording.GameRecorder, given every placed piece. Closed and removed when the game restarts
 	
 	def restart(self):
+		if self.recorder is not None:
+			self.recorder.close()
+			self.recorder = None
 		self.blockMat = [['empty'] * self.colNum for i in range(self.rowNum)]
+		self.refreshOccupancy()
 		
 		self.piece = MovingPiece(self.colNum,self.rowNum,'uncreated')
 		
 		self.lineClearStatus = 'idle'
 		self.clearedLines = [-1,-1,-1,-1]		
 		gameClock.fall.preFrame = gameClock.frameTick
-		self.generateNextTwoPieces()
+		self.generateNextPieces()
 		self.gameStatus = 'running'
 		self.gamePause = False
 		
@@ -194,17 +296,25 @@ class MainBoard:
 		self.lines = 0
 		
 		gameClock.restart()
+	
+	def refreshOccupancy(self):
+		fillOccupancy(self.blockMat,self.occupancy)
+		self.occupancyVersion = self.occupancyVersion + 1
 		
 	def erase_BLOCK(self,xRef,yRef,row,col):
 		pygame.draw.rect(gameDisplay, BLACK, [xRef+(col*self.blockSize),yRef+(row*self.blockSize),self.blockSize,self.blockSize],0)
 		
+	def getBlockSprite(self,color): #Returns the block surface of the color: a black outline of blockLineWidth around the filled inside
+		sprite = self.blockSprites.get(color)
+		if sprite is None:
+			sprite = pygame.Surface((self.blockSize,self.blockSize))
+			sprite.fill(BLACK)
+			pygame.draw.rect(sprite, color, [self.blockLineWidth,self.blockLineWidth,self.blockSize-(2*self.blockLineWidth),self.blockSize-(2*self.blockLineWidth)],0)
+			self.blockSprites[color] = sprite
+		return sprite
+		
 	def draw_BLOCK(self,xRef,yRef,row,col,color):
-		pygame.draw.rect(gameDisplay, BLACK, [xRef+(col*self.blockSize),yRef+(row*self.blockSize),self.blockSize,self.blockLineWidth],0)
-		pygame.draw.rect(gameDisplay, BLACK, [xRef+(col*self.blockSize)+self.blockSize-self.blockLineWidth,yRef+(row*self.blockSize),self.blockLineWidth,self.blockSize],0)
-		pygame.draw.rect(gameDisplay, BLACK, [xRef+(col*self.blockSize),yRef+(row*self.blockSize),self.blockLineWidth,self.blockSize],0)
-		pygame.draw.rect(gameDisplay, BLACK, [xRef+(col*self.blockSize),yRef+(row*self.blockSize)+self.blockSize-self.blockLineWidth,self.blockSize,self.blockLineWidth],0)
-
-		pygame.draw.rect(gameDisplay, color, [xRef+(col*self.blockSize)+self.blockLineWidth,yRef+(row*self.blockSize)+self.blockLineWidth,self.blockSize-(2*self.blockLineWidth),self.blockSize-(2*self.blockLineWidth)],0)
+		gameDisplay.blit(self.getBlockSprite(color),(xRef+(col*self.blockSize),yRef+(row*self.blockSize)))
 	
 	def draw_GAMEBOARD_BORDER(self):
 		pygame.draw.rect(gameDisplay, BORDER_COLOR, [self.xPos-self.boardLineWidth-self.blockLineWidth,self.yPos-self.boardLineWidth-self.blockLineWidth,(self.blockSize*self.colNum)+(2*self.boardLineWidth)+(2*self.blockLineWidth),self.boardLineWidth],0)
@@ -216,10 +326,10 @@ class MainBoard:
 	
 		if self.gameStatus == 'firstStart':	
 			
-			titleText = fontTitle.render('TETRIS', False, WHITE)
+			titleText = renderText(fontTitle,'TETRIS',WHITE)
 			gameDisplay.blit(titleText,(self.xPos++1.55*self.blockSize,self.yPos+8*self.blockSize))
 			
-			versionText = fontVersion.render('v 1.0', False, WHITE)
+			versionText = renderText(fontVersion,'v 1.0',WHITE)
 			gameDisplay.blit(versionText,(self.xPos++7.2*self.blockSize,self.yPos+11.5*self.blockSize))
 			
 		else:
@@ -237,14 +347,14 @@ class MainBoard:
 					
 			if self.gamePause == True:
 				pygame.draw.rect(gameDisplay, DARK_GRAY, [self.xPos+1*self.blockSize,self.yPos+8*self.blockSize,8*self.blockSize,4*self.blockSize],0)
-				pauseText = fontPAUSE.render('PAUSE', False, BLACK)
+				pauseText = renderText(fontPAUSE,'PAUSE',BLACK)
 				gameDisplay.blit(pauseText,(self.xPos++1.65*self.blockSize,self.yPos+8*self.blockSize))
 			
 			if self.gameStatus == 'gameOver':
 				pygame.draw.rect(gameDisplay, LIGHT_GRAY, [self.xPos+1*self.blockSize,self.yPos+8*self.blockSize,8*self.blockSize,8*self.blockSize],0)
-				gameOverText0 = fontGAMEOVER.render('GAME', False, BLACK)
+				gameOverText0 = renderText(fontGAMEOVER,'GAME',BLACK)
 				gameDisplay.blit(gameOverText0,(self.xPos++2.2*self.blockSize,self.yPos+8*self.blockSize))
-				gameOverText1 = fontGAMEOVER.render('OVER', False, BLACK)
+				gameOverText1 = renderText(fontGAMEOVER,'OVER',BLACK)
 				gameDisplay.blit(gameOverText1,(self.xPos++2.35*self.blockSize,self.yPos+12*self.blockSize))
 		
 		
@@ -260,73 +370,127 @@ class MainBoard:
 		yLastBlock = self.yPos+(self.blockSize*self.rowNum)
 	
 		if self.gameStatus == 'running':
-			nextPieceText = fontSB.render('next:', False, TEXT_COLOR)
-			gameDisplay.blit(nextPieceText,(xPosRef+self.blockSize,self.yPos))
+			if len(self.nextPieces) > 1: #The next piece panel is left empty without a preview
+				nextPieceText = renderText(fontSB,'next:',TEXT_COLOR)
+				gameDisplay.blit(nextPieceText,(xPosRef+self.blockSize,self.yPos))
 			
-			blocks = [[0,0],[0,0],[0,0],[0,0]]
-			origin = [0,0]
-			for i in range(0,4):
-				blocks[i][ROW] = origin[ROW] + pieceDefs[self.nextPieces[1]][i][ROW]
-				blocks[i][COL] = origin[COL] + pieceDefs[self.nextPieces[1]][i][COL]
+				blocks = [[0,0],[0,0],[0,0],[0,0]]
+				origin = [0,0]
+				for i in range(0,4):
+					blocks[i][ROW] = origin[ROW] + pieceDefs[self.nextPieces[1]][i][ROW]
+					blocks[i][COL] = origin[COL] + pieceDefs[self.nextPieces[1]][i][COL]
 				
-				if self.nextPieces[1] == 'O':
-					self.draw_BLOCK(xPosRef+0.5*self.blockSize,yPosRef+2.25*self.blockSize,blocks[i][ROW],blocks[i][COL],blockColors[self.nextPieces[1]])
-				elif self.nextPieces[1] == 'I':
-					self.draw_BLOCK(xPosRef+0.5*self.blockSize,yPosRef+1.65*self.blockSize,blocks[i][ROW],blocks[i][COL],blockColors[self.nextPieces[1]])
-				else:
-					self.draw_BLOCK(xPosRef+1*self.blockSize,yPosRef+2.25*self.blockSize,blocks[i][ROW],blocks[i][COL],blockColors[self.nextPieces[1]])
+					if self.nextPieces[1] == 'O':
+						self.draw_BLOCK(xPosRef+0.5*self.blockSize,yPosRef+2.25*self.blockSize,blocks[i][ROW],blocks[i][COL],blockColors[self.nextPieces[1]])
+					elif self.nextPieces[1] == 'I':
+						self.draw_BLOCK(xPosRef+0.5*self.blockSize,yPosRef+1.65*self.blockSize,blocks[i][ROW],blocks[i][COL],blockColors[self.nextPieces[1]])
+					else:
+						self.draw_BLOCK(xPosRef+1*self.blockSize,yPosRef+2.25*self.blockSize,blocks[i][ROW],blocks[i][COL],blockColors[self.nextPieces[1]])
 			
 			if self.gamePause == False:
-				pauseText = fontSmall.render('P -> pause', False, WHITE)
+				pauseText = renderText(fontSmall,'P -> pause',WHITE)
 				gameDisplay.blit(pauseText,(xPosRef+1*self.blockSize,yLastBlock-15*self.blockSize))
 			else:
-				unpauseText = fontSmall.render('P -> unpause', False, self.whiteSineAnimation())
+				unpauseText = renderText(fontSmall,'P -> unpause',self.whiteSineAnimation())
 				gameDisplay.blit(unpauseText,(xPosRef+1*self.blockSize,yLastBlock-15*self.blockSize))
 				
-			restartText = fontSmall.render('R -> restart', False, WHITE)
+			restartText = renderText(fontSmall,'R -> restart',WHITE)
 			gameDisplay.blit(restartText,(xPosRef+1*self.blockSize,yLastBlock-14*self.blockSize))
 					
 		else:
 		
 			yBlockRef = 0.3
-			text0 = fontSB.render('press', False, self.whiteSineAnimation())
+			text0 = renderText(fontSB,'press',self.whiteSineAnimation())
 			gameDisplay.blit(text0,(xPosRef+self.blockSize,self.yPos+yBlockRef*self.blockSize))
-			text1 = fontSB.render('enter', False, self.whiteSineAnimation())
+			text1 = renderText(fontSB,'enter',self.whiteSineAnimation())
 			gameDisplay.blit(text1,(xPosRef+self.blockSize,self.yPos+(yBlockRef+1.5)*self.blockSize))
-			text2 = fontSB.render('to', False, self.whiteSineAnimation())
+			text2 = renderText(fontSB,'to',self.whiteSineAnimation())
 			gameDisplay.blit(text2,(xPosRef+self.blockSize,self.yPos+(yBlockRef+3)*self.blockSize))
 			if self.gameStatus == 'firstStart':
-				text3 = fontSB.render('start', False, self.whiteSineAnimation())
+				text3 = renderText(fontSB,'start',self.whiteSineAnimation())
 				gameDisplay.blit(text3,(xPosRef+self.blockSize,self.yPos+(yBlockRef+4.5)*self.blockSize))
 			else:
-				text3 = fontSB.render('restart', False, self.whiteSineAnimation())
+				text3 = renderText(fontSB,'restart',self.whiteSineAnimation())
 				gameDisplay.blit(text3,(xPosRef+self.blockSize,self.yPos+(yBlockRef+4.5)*self.blockSize))		
 		
 		pygame.draw.rect(gameDisplay, BORDER_COLOR, [xPosRef,yLastBlock-12.5*self.blockSize,self.scoreBoardWidth,self.boardLineWidth],0)
 		
-		scoreText = fontSB.render('score:', False, TEXT_COLOR)
+		scoreText = renderText(fontSB,'score:',TEXT_COLOR)
 		gameDisplay.blit(scoreText,(xPosRef+self.blockSize,yLastBlock-12*self.blockSize))
-		scoreNumText = fontSB.render(str(self.score), False, NUM_COLOR)
+		scoreNumText = renderText(fontSB,str(self.score),NUM_COLOR)
 		gameDisplay.blit(scoreNumText,(xPosRef+self.blockSize,yLastBlock-10*self.blockSize))
 		
-		levelText = fontSB.render('level:', False, TEXT_COLOR)
+		levelText = renderText(fontSB,'level:',TEXT_COLOR)
 		gameDisplay.blit(levelText,(xPosRef+self.blockSize,yLastBlock-8*self.blockSize))
-		levelNumText = fontSB.render(str(self.level), False, NUM_COLOR)
+		levelNumText = renderText(fontSB,str(self.level),NUM_COLOR)
 		gameDisplay.blit(levelNumText,(xPosRef+self.blockSize,yLastBlock-6*self.blockSize))
 		
-		linesText = fontSB.render('lines:', False, TEXT_COLOR)
+		linesText = renderText(fontSB,'lines:',TEXT_COLOR)
 		gameDisplay.blit(linesText,(xPosRef+self.blockSize,yLastBlock-4*self.blockSize))
-		linesNumText = fontSB.render(str(self.lines), False, NUM_COLOR)
+		linesNumText = renderText(fontSB,str(self.lines),NUM_COLOR)
 		gameDisplay.blit(linesNumText,(xPosRef+self.blockSize,yLastBlock-2*self.blockSize))
 	
+	def getCells(self): #Returns what each board cell shows: blockMat with the moving piece on top
+		cells = [list(row) for row in self.blockMat]
+		if self.piece.status == 'moving':
+			for i in range(0,4):
+				if self.piece.blocks[i].currentPos.row >= 0:
+					cells[self.piece.blocks[i].currentPos.row][self.piece.blocks[i].currentPos.col] = self.piece.type
+		return cells
+	
 	# All the screen drawings occurs in this function, called at each game loop iteration
+	# Only what changed since the last call is drawn, and the changed areas are returned as a list of rects for pygame.display.update
 	def draw(self):
 		
-		self.draw_GAMEBOARD_BORDER()
-		self.draw_SCOREBOARD_BORDER()
-		
-		self.draw_GAMEBOARD_CONTENT()
-		self.draw_SCOREBOARD_CONTENT()
+		initDisplay()
+		rects = []
+		boardRect = pygame.Rect(self.xPos,self.yPos,self.blockSize*self.colNum,self.blockSize*self.rowNum)
+		scoreBoardRect = pygame.Rect(self.xPos+(self.blockSize*self.colNum)+self.boardLineWidth+self.blockLineWidth,self.yPos-self.blockLineWidth,self.scoreBoardWidth,(self.blockSize*self.rowNum)+(2*self.blockLineWidth))
+		
+		if self.drawnCells is None:
+			gameDisplay.fill(BLACK)
+			self.draw_GAMEBOARD_BORDER()
+			self.draw_SCOREBOARD_BORDER()
+			self.drawnBoardState = None
+			self.drawnScoreState = None
+			rects.append(gameDisplay.get_rect())
+		
+		#Game board. Cells are redrawn one by one, unless a text overlay is shown or changes, which redraws the whole board
+		cells = self.getCells()
+		overlay = self.gameStatus != 'running' or self.gamePause
+		boardState = (self.gameStatus,self.gamePause)
+		if self.drawnCells is None or boardState != self.drawnBoardState or (overlay and cells != self.drawnCells):
+			gameDisplay.fill(BLACK,boardRect)
+			gameDisplay.set_clip(boardRect)
+			self.draw_GAMEBOARD_CONTENT()
+			gameDisplay.set_clip(None)
+			rects.append(boardRect)
+		else:
+			for row in range(0,self.rowNum):
+				if cells[row] != self.drawnCells[row]:
+					for col in range(0,self.colNum):
+						if cells[row][col] != self.drawnCells[row][col]:
+							if cells[row][col] == 'empty':
+								self.erase_BLOCK(self.xPos,self.yPos,row,col)
+							else:
+								self.draw_BLOCK(self.xPos,self.yPos,row,col,blockColors[cells[row][col]])
+							rects.append(pygame.Rect(self.xPos+(col*self.blockSize),self.yPos+(row*self.blockSize),self.blockSize,self.blockSize))
+		self.drawnCells = cells
+		self.drawnBoardState = boardState
+		
+		#Scoreboard, redrawn when any of its values change or its text is blinking
+		scoreState = (self.gameStatus,self.gamePause,tuple(self.nextPieces[1:2]),self.score,self.level,self.lines)
+		if overlay:
+			scoreState = scoreState + (tuple(self.whiteSineAnimation()),)
+		if scoreState != self.drawnScoreState:
+			gameDisplay.fill(BLACK,scoreBoardRect)
+			gameDisplay.set_clip(scoreBoardRect)
+			self.draw_SCOREBOARD_CONTENT()
+			gameDisplay.set_clip(None)
+			rects.append(scoreBoardRect)
+			self.drawnScoreState = scoreState
+		
+		return rects
 		
 	def whiteSineAnimation(self):
 		
@@ -387,14 +551,14 @@ class MainBoard:
 		self.lineClearStatus = 'idle'
 		self.piece.status = 'uncreated'
 	
-	def generateNextTwoPieces(self):
-		self.nextPieces[0] = pieceNames[random.randint(0,6)]
-		self.nextPieces[1] = pieceNames[random.randint(0,6)]
+	def generateNextPieces(self): #Fills the whole preview queue
+		for i in range(len(self.nextPieces)):
+			self.nextPieces[i] = pieceNames[random.randint(0,6)]
 		self.piece.type = self.nextPieces[0]
 		
 	def generateNextPiece(self):
-		self.nextPieces[0] = self.nextPieces[1]
-		self.nextPieces[1] = pieceNames[random.randint(0,6)]
+		self.nextPieces.pop(0)
+		self.nextPieces.append(pieceNames[random.randint(0,6)])
 		self.piece.type = self.nextPieces[0]
 		
 	def checkAndApplyGameOver(self):
@@ -403,6 +567,7 @@ class MainBoard:
 			for i in range(0,4):
 				if self.piece.blocks[i].currentPos.row >= 0 and self.piece.blocks[i].currentPos.col >= 0:
 					self.blockMat[self.piece.blocks[i].currentPos.row][self.piece.blocks[i].currentPos.col] = self.piece.type
+			self.refreshOccupancy()
 	
 	def updateScores(self):
 		
@@ -415,9 +580,7 @@ class MainBoard:
 		#if self.score > 999999:
 			#self.score = 999999
 		self.lines = self.lines + clearedLinesNum
-		self.level = STARTING_LEVEL + math.floor(self.lines/10)
-		if self.level > 99:
-			self.level = 99
+		self.level = getLevel(self.lines)
 	
 	def updateSpeed(self):
 	
@@ -461,18 +624,29 @@ class MainBoard:
 						if key.cRotate.trig == True:	
 							self.piece.rotate('cCW')
 							key.cRotate.trig = False
+						
+						if key.hardDrop.trig == True:
+							self.piece.hardDrop()
+							key.hardDrop.trig = False
 							
 					elif self.piece.status == 'collided':			
 						if self.lineClearStatus == 'idle':
 							for i in range(0,4):
 								self.blockMat[self.piece.blocks[i].currentPos.row][self.piece.blocks[i].currentPos.col] = self.piece.type
+							self.refreshOccupancy()
+							pieceType = self.piece.type #getCompleteLines already prepares the next piece when no lines clear
+							previousScore = self.score
 							self.clearedLines = self.getCompleteLines()
 							self.updateScores()
 							self.updateSpeed()
+							if self.recorder is not None:
+								orientation, col = findPlacement(pieceType,[[block.currentPos.row,block.currentPos.col] for block in self.piece.blocks])
+								self.recorder.record(pieceType,orientation,col,4 - self.clearedLines.count(-1),self.score - previousScore)
 						elif self.lineClearStatus == 'clearRunning':
 							self.lineClearAnimation()
 						else: # 'clearFin'
-							self.dropFreeBlocks()					
+							self.dropFreeBlocks()
+							self.refreshOccupancy()
 							self.prepareNextSpawn()
 			
 			else: # self.gamePause = False
@@ -486,6 +660,113 @@ class MainBoard:
 				self.restart()
 				
 
+class GameEngine:
+	"""
+	Headless game logic that advances one piece placement per step.
+	Keeps the scoring and leveling rules of MainBoard, but does not render, tick frames or animate line clears.
+	Each placement is hard dropped from where the piece spawns, and scores its drop like MovingPiece.hardDrop.
+	"""
+	def __init__(self,colNum=10,rowNum=20,seed=None,previewNum=1):
+		
+		self.colNum = colNum
+		self.rowNum = rowNum
+		self.previewNum = previewNum
+		self.random = random.Random(seed)
+		self.occupancyVersion = 0
+		self.recorder = None #Optional recording.GameRecorder, given every placed piece
+		self.restart()
+	
+	def restart(self):
+		self.blockMat = [['empty'] * self.colNum for i in range(self.rowNum)]
+		self.occupancy = [0] * self.rowNum #Numeric mirror of blockMat, as in MainBoard
+		self.occupancyVersion = self.occupancyVersion + 1
+		
+		self.piece = MovingPiece(self.colNum,self.rowNum,'uncreated')
+		self.nextPieces = ['I'] * (self.previewNum + 1)
+		self.gameStatus = 'running'
+		
+		self.score = 0
+		self.level = STARTING_LEVEL
+		self.lines = 0
+		self.pieceCount = 0
+		
+		self.generateNextPieces()
+		self.spawnPiece()
+	
+	def generateNextPieces(self):
+		for i in range(len(self.nextPieces)):
+			self.nextPieces[i] = pieceNames[self.random.randint(0,6)]
+		
+	def generateNextPiece(self):
+		self.nextPieces.pop(0)
+		self.nextPieces.append(pieceNames[self.random.randint(0,6)])
+	
+	def spawnPiece(self): #Spawns the current piece like MovingPiece.move does, so the bot can read it
+		self.piece = MovingPiece(self.colNum,self.rowNum,'moving')
+		self.piece.type = self.nextPieces[0]
+		self.piece.blockMat = self.blockMat
+		self.piece.spawn()
+		if self.piece.gameOverCondition == True:
+			self.gameStatus = 'gameOver'
+	
+	def getDropRow(self,pieceDef,col): #Returns the row the piece definition lands on when dropped from the top at the given column, -1 if it does not fit
+		row = -1
+		while row + 1 < self.rowNum:
+			for pos in pieceDef:
+				if row + 1 + pos[ROW] > self.rowNum - 1 or self.blockMat[row + 1 + pos[ROW]][col + pos[COL]] != 'empty':
+					return row
+			row = row + 1
+		return row
+	
+	def clearLines(self): #Removes the complete lines and returns their count
+		remainingRows = [row for row in self.blockMat if 'empty' in row]
+		clearedLinesNum = self.rowNum - len(remainingRows)
+		if clearedLinesNum > 0:
+			self.blockMat[:] = [['empty'] * self.colNum for i in range(clearedLinesNum)] + remainingRows
+		return clearedLinesNum
+	
+	def step(self,placement):
+		"""
+		Drops the current piece with the given placement and spawns the next one.
+		A placement is (orientation, col): the number of clockwise rotations from spawn and the leftmost column of the piece.
+		Returns (lines, score, gameOver) where lines is the number of lines cleared by this placement.
+		"""
+		if self.gameStatus == 'gameOver':
+			return 0, self.score, True
+		
+		orientation, col = placement
+		pieceDef = getPlacementDef(self.piece.type,orientation)
+		width = max(pos[COL] for pos in pieceDef) + 1
+		if col < 0 or col + width > self.colNum:
+			raise ValueError("Placement column %d is out of the board for piece %s" % (col, self.piece.type))
+		
+		row = self.getDropRow(pieceDef,col)
+		if row < 0: #The piece cannot enter the board at that column
+			self.gameStatus = 'gameOver'
+			return 0, self.score, True
+		
+		for pos in pieceDef:
+			self.blockMat[row + pos[ROW]][col + pos[COL]] = self.piece.type
+			self.occupancy[row + pos[ROW]] = self.occupancy[row + pos[ROW]] | (1 << (col + pos[COL]))
+		
+		clearedLinesNum = self.clearLines()
+		if clearedLinesNum > 0:
+			fillOccupancy(self.blockMat,self.occupancy)
+		self.occupancyVersion = self.occupancyVersion + 1
+		scoreDelta = (self.level+1)*baseLinePoints[clearedLinesNum] + getDropScore(self.piece.type,orientation,row)
+		self.score = self.score + scoreDelta
+		self.lines = self.lines + clearedLinesNum
+		self.level = getLevel(self.lines)
+		self.pieceCount = self.pieceCount + 1
+		if self.recorder is not None:
+			self.recorder.record(self.piece.type,orientation,col,clearedLinesNum,scoreDelta)
+		
+		self.generateNextPiece()
+		self.spawnPiece()
+		
+		return clearedLinesNum, self.score, self.gameStatus == 'gameOver'
+
+
 class MovingPiece:
 	"""Class for all the definitions of current moving piece"""
 
@@ -555,6 +836,21 @@ class MovingPiece:
 				return True
 		return False
 		
+	def shift(self,dirType): #Moves the piece one column 'left' or 'right' right away, unless it collides. Returns whether it moved
+		if self.movCollisionCheck(dirType) == True:
+			return False
+		self.createNextMove(dirType)
+		self.applyNextMove()
+		return True
+	
+	def hardDrop(self): #Drops the piece to where it lands and locks it in this frame. Each row dropped scores like a soft drop
+		while self.movCollisionCheck('down') == False:
+			self.createNextMove('down')
+			self.applyNextMove()
+			self.dropScore = self.dropScore + 1
+		self.createNextMove('noMove')
+		self.status = 'collided'
+		
 	def rotCollisionCheck_BLOCK(self,blockCoor):
 		if ( blockCoor[ROW]>self.rowNum-1 or blockCoor[ROW]<0 or blockCoor[COL]>self.colNum-1 or blockCoor[COL]<0 or self.blockMat[blockCoor[ROW]][blockCoor[COL]] != 'empty'):
 			return True
@@ -613,7 +909,7 @@ class MovingPiece:
 
 		self.dropScore = 0
 		
-		origin = [0,3]
+		origin = [0,getSpawnCol(self.colNum)]
 		
 		for i in range(0,4):		
 			self.currentDef[i] = list(pieceDefs[self.type][i])	
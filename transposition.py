@@ -0,0 +1,105 @@
+"""
+Transposition table for the bot's search.
+Boards are keyed by a Zobrist hash of their occupancy, which can be updated incrementally
+by XORing the keys of the cells a piece fills.
+"""
+import random
+import sys
+from collections import OrderedDict
+
+ENTRY_OVERHEAD = 256 # estimated bytes of an entry besides its board and column heights
+
+class ZobristKeys:
+	"""Random 64-bit keys for every cell of a board with the given size."""
+	def __init__(self, rowNum, colNum, seed=0):
+		rng = random.Random(seed)
+		self.rowNum = rowNum
+		self.colNum = colNum
+		self.keys = [[rng.getrandbits(64) for j in range(colNum)] for i in range(rowNum)]
+
+
+	def hashBoard(self, data):
+		"""Returns the hash of a 2d board, where non-zero cells are filled."""
+		h = 0
+		for i, row in enumerate(data):
+			for j, cell in enumerate(row):
+				if cell != 0:
+					h ^= self.keys[i][j]
+		return h
+
+
+	def hashRows(self, rows):
+		"""Returns the hash of a bitboard, a list of row integers."""
+		h = 0
+		for i, bits in enumerate(rows):
+			while bits:
+				low = bits & -bits
+				h ^= self.keys[i][low.bit_length() - 1]
+				bits ^= low
+		return h
+
+
+	def hashPiece(self, pieceDef, row, col):
+		"""Returns the hash of the piece's cells placed at (row, col), to XOR into the hash of the board it lands on."""
+		h = 0
+		for pos in pieceDef:
+			if row + pos[0] >= 0:
+				h ^= self.keys[row + pos[0]][col + pos[1]]
+		return h
+
+
+class TranspositionTable:
+	"""
+	Caches computed board metrics and evaluations by Zobrist hash.
+	Least recently used entries are evicted once the estimated memory use passes maxBytes.
+	"""
+	def __init__(self, maxBytes=32*1024*1024):
+		self.maxBytes = maxBytes
+		self.entries = OrderedDict() # hash -> (value, size)
+		self.usedBytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+
+	def get(self, key):
+		"""Returns the cached value for key, or None. Counts a hit or a miss."""
+		entry = self.entries.get(key)
+		if entry is None:
+			self.misses += 1
+			return None
+		self.entries.move_to_end(key)
+		self.hits += 1
+		return entry[0]
+
+
+	def put(self, key, value, data, heights):
+		"""Stores value for key. The board data and column heights it holds are used to estimate its size."""
+		if key in self.entries:
+			return
+		size = ENTRY_OVERHEAD + sys.getsizeof(data) + sys.getsizeof(heights)
+		self.entries[key] = (value, size)
+		self.usedBytes += size
+		while self.usedBytes > self.maxBytes and self.entries:
+			oldKey, (oldValue, oldSize) = self.entries.popitem(last=False)
+			self.usedBytes -= oldSize
+			self.evictions += 1
+
+
+	def clear(self):
+		"""Removes all entries, keeping the counters."""
+		self.entries.clear()
+		self.usedBytes = 0
+
+
+	def getStats(self):
+		"""Returns the hit/miss counters and memory use as a dict."""
+		lookups = self.hits + self.misses
+		return {
+			'hits': self.hits,
+			'misses': self.misses,
+			'hitRate': self.hits / lookups if lookups else 0.0,
+			'entries': len(self.entries),
+			'usedBytes': self.usedBytes,
+			'evictions': self.evictions,
+		}